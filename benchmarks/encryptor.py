@@ -0,0 +1,54 @@
+"""
+Load and save latency of an encrypted bank, deriving the key for every call (as it was before keys were cached)
+and with the cached keys.
+
+    python -m benchmarks.encryptor [tests] [results per test]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from utils.helpers import Encryptor, Test, Question, Answer, StudentDegree
+from utils.parsers import dump_tests, parse_tests
+from utils.results import ResultColumns
+
+
+def make_bank(tests: int, results: int):
+    return [Test(i, "Test {}".format(i), "", 3600,
+                 [Question("Question {}".format(q), None, [Answer("Answer {}".format(a), a == 0) for a in range(4)])
+                  for q in range(20)],
+                 100.0,
+                 ResultColumns(StudentDegree("Student {}".format(r), "01000000000", "School", "Grade", 50.0, 100.0,
+                                             [], [], [1] * 20)
+                               for r in range(results)))
+            for i in range(tests)]
+
+
+def timed(f, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main(tests: int = 20, results: int = 200, runs: int = 5) -> None:
+    bank = make_bank(tests, results)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "data.enc")
+        dump_tests(bank, path, encrypt=True)
+
+        cached = Encryptor.cache_size
+        for label, cache_size in (("before (a key derived every call)", 0), ("after (keys cached)", cached)):
+            Encryptor.cache_size = cache_size
+            Encryptor._keys.clear()
+            load = timed(lambda: parse_tests(path, encrypted=True), runs)
+            save = timed(lambda: dump_tests(bank, path, encrypt=True), runs)
+            print("{:<36} load {:8.1f} ms   save {:8.1f} ms".format(label, load, save))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
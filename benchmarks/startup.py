@@ -0,0 +1,42 @@
+"""
+What the station does at startup, listing the tests and opening one, against loading the whole bank (as it did
+before there were summaries and single-test reads), on a `FileStorage` of a generated bank.
+
+    python -m benchmarks.startup [tests] [results per test]
+"""
+import os
+import sys
+import tempfile
+
+from utils.storage import FileStorage
+from utils.journal import SegmentedJournal
+from utils.vals import JOURNAL_COMPACT_SIZE
+
+from .encryptor import make_bank, timed
+
+
+def main(tests: int = 50, results: int = 500, runs: int = 5) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        def storage() -> FileStorage:  # a fresh one every run, nothing's cached between them
+            return FileStorage(os.path.join(directory, "data.enc"),
+                               SegmentedJournal(directory, "bench", JOURNAL_COMPACT_SIZE),
+                               os.path.join(directory, "index.enc"))
+
+        storage().save(make_bank(tests, results))
+        test_id = tests // 2
+
+        def startup() -> None:
+            s = storage()
+            s.summaries()
+            s.load_test(test_id)
+
+        def whole() -> None:
+            s = storage()
+            next(test for test in s.load() if test.id == test_id)
+
+        print("{:<36} {:8.1f} ms".format("before (the whole bank loaded)", timed(whole, runs)))
+        print("{:<36} {:8.1f} ms".format("after (summaries, one test)", timed(startup, runs)))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
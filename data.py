@@ -1,6 +1,44 @@
-from utils.helpers import res, _init
-from utils.parsers import parse_tests
+from typing import List, Tuple
+
+from utils.helpers import Test, StudentDegree, _init
+from utils.saver import SaveWorker
+from utils.storage import open_storage
+from utils.vals import STORAGE_BACKEND
 
 _init()
 
-TESTS = parse_tests(res("data.enc", "state"), encrypted=True)
+STORAGE = open_storage(STORAGE_BACKEND)
+# everything written to `STORAGE` from the gui goes through it
+SAVER = SaveWorker(STORAGE)
+
+# only filled (by `load_tests`) when the whole bank is needed, e.g. by the editor
+TESTS = []  # type: List[Test]
+_LOADED = [False]
+
+
+def load_tests() -> List[Test]:
+    if not _LOADED[0]:
+        TESTS.extend(STORAGE.load())
+        _LOADED[0] = True
+    return TESTS
+
+
+def _results_added(results: List[Tuple[int, StudentDegree]]) -> None:
+    # whoever submitted them (this station, or another through the results server), they belong to the tests
+    # loaded here too
+    if _LOADED[0]:
+        tests = {test.id: test for test in TESTS}
+        for test_id, degree in results:
+            if test_id in tests:
+                tests[test_id].student_degrees.append(degree)
+
+
+SAVER.results_added.connect(_results_added)
+
+
+def load_test(test_id: int) -> Test:
+    if _LOADED[0]:
+        for test in TESTS:
+            if test.id == test_id:
+                return test
+    return STORAGE.load_test(test_id)
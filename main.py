@@ -6,20 +6,25 @@
 """
 
 import hashlib
+import logging
 import sys
 from typing import List
 
 from PyQt4 import QtGui, QtCore
 
-from data import TESTS
+from data import SAVER, STORAGE, load_test
 from utils.helpers import (
     res, center_widget,
     _init, _defer
 )
+from utils.server import ResultsServer
+from utils.vals import SERVER_HOST, SERVER_PORT
 from widgets.editor import TestsEditor
 from widgets.innerwidgets import TestCard
 from widgets.tester import TestWizard
 
+log = logging.getLogger(__name__)
+
 # it's just used to make the garbage collector doesn't delete the window reference
 CURRENT_ACTIVE = [None]  # type: List[QtGui.QWidget]
 
@@ -123,14 +128,26 @@ class TestChooser(QtGui.QWidget):  # the real MainWindow is a QWidget, that's fu
         self.setLayout(topmost)
         lyt.setMargin(8)
 
-        a = len(TESTS)
+        try:
+            self.summaries = STORAGE.summaries()
+        except (OSError, RuntimeError) as e:  # the server (for a station) can't be reached, or failed
+            log.warning("couldn't list the tests: %s", e)
+            self.summaries = []
+            error = QtGui.QLabel("تعذر الوصول إلى الإمتحانات، تأكد من الاتصال ثم أعد المحاولة.")
+            error.setToolTip(str(e))
+            lyt.addWidget(error, alignment=QtCore.Qt.AlignCenter)
+            retry_link = QtGui.QLabel("<a href='#retry'>أعد المحاولة</a>")
+            retry_link.linkActivated.connect(lambda _: self.retry())
+            lyt.addWidget(retry_link, alignment=QtCore.Qt.AlignCenter)
+            return
+        a = len(self.summaries)
 
         if a == 0:
             lyt.addWidget(QtGui.QLabel("لا يوجد أية إمتحان، اضف واحدًا لتكمل."), alignment=QtCore.Qt.AlignCenter)
             return
 
-        for i, test in enumerate(TESTS):
-            lyt.addWidget(TestCard(test, i, self, chose=self.chose))
+        for i, summary in enumerate(self.summaries):
+            lyt.addWidget(TestCard(summary, i, self, chose=self.chose))
 
         if a > 1:
             lyt.addWidget(QtGui.QLabel("<hr>"))
@@ -138,6 +155,9 @@ class TestChooser(QtGui.QWidget):  # the real MainWindow is a QWidget, that's fu
 
         login_link = QtGui.QLabel("<a href='#open'>Open tests editor</a>")
         login_link.setOpenExternalLinks(False)
+        if STORAGE.read_only:
+            login_link.setEnabled(False)
+            login_link.setToolTip("The tests are edited on the machine serving them")
 
         def f(_):
             auth = Auth(parent=self)
@@ -156,8 +176,25 @@ class TestChooser(QtGui.QWidget):  # the real MainWindow is a QWidget, that's fu
         dwn.addWidget(login_link, alignment=QtCore.Qt.AlignRight)
         topmost.addLayout(dwn)
 
+    def retry(self):
+        chooser = TestChooser()
+        center_widget(chooser)
+        chooser.show()
+        CURRENT_ACTIVE[0] = chooser
+        self.close()
+
     def chose(self, index):
-        wizard = TestWizard(TESTS[index])
+        try:
+            test = load_test(self.summaries[index].id)
+        except (OSError, RuntimeError, KeyError) as e:
+            QtGui.QMessageBox.warning(self, "Couldn't Load", "The test couldn't be loaded, try again:\n" + str(e))
+            return
+        problem = TestWizard.problem(test)
+        if problem is not None:
+            QtGui.QMessageBox.warning(self, "Invalid Test", "The test can't be taken, fix it in the editor:\n"
+                                      + problem)
+            return
+        wizard = TestWizard(test)
         CURRENT_ACTIVE[0] = wizard
         wizard.parent_window = self
         center_widget(wizard)
@@ -171,10 +208,18 @@ def main():
     app.setApplicationName("Examer")
     app.setApplicationVersion("0.1")
     app.setWindowIcon(QtGui.QIcon(res("test.ico", "icon")))
+    server = None
+    if "--serve" in sys.argv:  # the teacher's machine, the lab's stations send their results here
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+        server = ResultsServer(STORAGE, SAVER.add_results, SERVER_HOST, SERVER_PORT)
+        server.start()
     main_widget = TestChooser()
     center_widget(main_widget)
     main_widget.show()
     app.exec_()
+    if server is not None:
+        server.stop()
+    SAVER.flush()  # don't leave before what's queued is written
     del main_widget
     del app
     _defer()
@@ -0,0 +1,17 @@
+from typing import Optional, Sequence
+
+from utils import helpers
+from utils.helpers import Question, Answer, StudentDegree
+from utils.results import ResultColumns
+
+
+def degree(name: str = "Student", points: float = 1.0, responses: Sequence[int] = (1,),
+           fingerprint: str = "") -> StudentDegree:
+    return StudentDegree(name, "01000000000", "School", "Grade", points, 2.0, [], [], list(responses), fingerprint)
+
+
+def make_test(*names: str, test_id: int = 1, questions: Optional[Sequence[Question]] = None) -> helpers.Test:
+    """A test with a result for each of `names`, of one yes/no question unless it's given `questions`."""
+    if questions is None:
+        questions = (Question("Question", None, (Answer("Yes", True), Answer("No", False))),)
+    return helpers.Test(test_id, "Test", "", 60, questions, 2.0, ResultColumns(map(degree, names)))
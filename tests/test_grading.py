@@ -0,0 +1,29 @@
+from typing import List
+
+from utils.grading import AnswerKey, regrade
+from utils.helpers import Question, Answer, StudentDegree
+from utils.results import ResultColumns
+
+from .conftest import degree, make_test
+
+
+def questions(*answers: str) -> List[Question]:
+    return [Question("Question", None, [Answer(a, i == 0) for i, a in enumerate(answers)]),
+            Question("Another", None, [Answer("Yes", False), Answer("No", True)])]
+
+
+def answered(fingerprint: str, responses=(1, 2)) -> StudentDegree:
+    return degree(points=0.0, responses=responses, fingerprint=fingerprint)
+
+
+def test_regrade_only_what_was_answered_against_the_same_questions():
+    key = AnswerKey(make_test(questions=questions("Right", "Wrong")))
+    # the answers swapped, a response's bits mean others now
+    other = AnswerKey(make_test(questions=questions("Wrong", "Right")))
+    assert key.fingerprint != other.fingerprint
+
+    results = ResultColumns([answered(key.fingerprint), answered(other.fingerprint), answered(""), answered("", ())])
+    rows, grades, skipped = regrade(key, results)
+    assert rows.tolist() == [0, 2]  # the last one has no responses, from before they were kept
+    assert grades.totals.tolist() == [2.0, 2.0]
+    assert skipped == 1
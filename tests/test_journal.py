@@ -0,0 +1,39 @@
+import os
+
+from utils.journal import ResultsJournal
+
+from .conftest import degree
+
+# a record torn by a crash: its length and only part of what it says
+TORN = b"\x90\x00\x00\x00" + b"\x01" * 40
+
+
+def names(journal: ResultsJournal):
+    return [degree.name for _, degree in journal.records()]
+
+
+def test_append_after_torn_tail(tmp_path):
+    path = str(tmp_path / "results.jnl")
+    ResultsJournal(path, 1 << 20).extend([(1, degree("before 0")), (1, degree("before 1"))])
+    with open(path, "ab") as f:
+        f.write(TORN)
+
+    ResultsJournal._repaired.discard(os.path.abspath(path))  # as in the next process to open it
+    journal = ResultsJournal(path, 1 << 20)
+    for i in range(3):
+        journal.append(1, degree("after {}".format(i)))
+
+    assert names(journal) == ["before 0", "before 1", "after 0", "after 1", "after 2"]
+    assert journal.read()[1] == journal.size
+
+
+def test_read_past_garbled_record(tmp_path):
+    path = str(tmp_path / "results.jnl")
+    journal = ResultsJournal(path, 1 << 20)
+    journal.append(1, degree("before"))
+    with open(path, "ab") as f:  # written without the torn record cut off
+        f.write(TORN)
+    journal.append(2, degree("after"))
+
+    assert names(journal) == ["before", "after"]
+    assert ResultsJournal(path, 1 << 20).read()[1] == journal.size
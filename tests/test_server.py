@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.server import ResultsServer, RemoteStorage
+from utils.storage import SQLiteStorage
+
+from .conftest import degree, make_test
+
+STATIONS = 8
+SUBMISSIONS = 10
+
+
+def test_results_submitted_by_many_stations_at_once(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "data.db"))
+    storage.save([make_test("first")])
+    writer = ThreadPoolExecutor(1)  # written one batch at a time, like the `SaveWorker` does
+    server = ResultsServer(storage, lambda results: writer.submit(storage.add_results, results), "127.0.0.1", 0)
+    server.start()
+
+    def station(i: int) -> None:
+        remote = RemoteStorage("127.0.0.1", server.port, timeout=10)
+        summary, = remote.summaries()
+        assert [d.name for d in remote.load_test(summary.id).student_degrees][0] == "first"
+        for j in range(SUBMISSIONS):
+            remote.add_results([(summary.id, degree("station {} {}".format(i, j)))])
+        with pytest.raises(PermissionError):
+            remote.save([])
+
+    try:
+        with ThreadPoolExecutor(STATIONS) as pool:
+            list(pool.map(station, range(STATIONS)))
+    finally:
+        server.stop()
+        writer.shutdown()
+
+    assert server.submitted == STATIONS * SUBMISSIONS
+    test, = storage.load()
+    assert sorted(d.name for d in test.student_degrees) == sorted(
+        ["first"] + ["station {} {}".format(i, j) for i in range(STATIONS) for j in range(SUBMISSIONS)])
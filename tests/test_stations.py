@@ -0,0 +1,47 @@
+import multiprocessing
+import os
+
+from utils import helpers
+from utils.journal import SegmentedJournal
+from utils.results import ResultColumns
+from utils.storage import FileStorage
+
+from .conftest import degree
+
+STATIONS = 4
+BATCHES = 12
+BATCH = 3
+# small enough for every station to fold the journal into the file a few times, racing the others for the lock
+THRESHOLD = 2048
+
+
+def storage(directory: str, station: str) -> FileStorage:
+    return FileStorage(os.path.join(directory, "data.enc"), SegmentedJournal(directory, station, THRESHOLD),
+                       os.path.join(directory, "index.enc"))
+
+
+def names(station: str):
+    return ["{} {} {}".format(station, batch, i) for batch in range(BATCHES) for i in range(BATCH)]
+
+
+def submit(directory: str, station: str) -> None:
+    s = storage(directory, station)
+    for batch in range(BATCHES):
+        s.add_results([(1, degree(name)) for name in names(station)[batch * BATCH:(batch + 1) * BATCH]])
+
+
+def test_concurrent_stations(tmp_path):
+    directory = str(tmp_path)
+    storage(directory, "editor").save([helpers.Test(1, "Test", "", 60, [], 2.0, ResultColumns())])
+
+    stations = ["station{}".format(i) for i in range(STATIONS)]
+    processes = [multiprocessing.Process(target=submit, args=(directory, station)) for station in stations]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(120)
+        assert process.exitcode == 0
+
+    test, = storage(directory, "reader").load()
+    assert sorted(d.name for d in test.student_degrees) == sorted(name for station in stations
+                                                                  for name in names(station))
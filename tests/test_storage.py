@@ -0,0 +1,106 @@
+import pytest
+
+from utils.results import ChangeLog
+from utils.journal import ResultsJournal, SegmentedJournal
+from utils.storage import FileStorage, ShardedStorage, SQLiteStorage
+
+from .conftest import degree, make_test
+
+
+def test_sqlite_save_keeps_results_submitted_meanwhile(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "data.db"))
+    storage.save([make_test("first", "second")])
+
+    loaded, = storage.load()
+    working, changes = loaded.student_degrees.copy(), ChangeLog(len(loaded.student_degrees))
+    storage.add_results([(1, degree("station"))])  # submitted while it's edited
+
+    old, working[0] = working[0], degree("first", 2.0)
+    changes.updated(0, old, working[0])
+    del working[1]
+    changes.removed(1)
+    working.append(degree("added"))
+    changes.appended()
+
+    deltas = {1: changes.apply(working, loaded.student_degrees)}
+    storage.save([loaded._replace(name="Renamed")], [1], deltas)
+
+    test, = storage.load()
+    assert test.name == "Renamed"
+    assert [(d.name, d.degree) for d in test.student_degrees] == [("first", 2.0), ("station", 1.0), ("added", 1.0)]
+
+
+def test_file_load_test_reads_one_test(tmp_path):
+    directory = str(tmp_path)
+    storage = FileStorage(str(tmp_path / "data.enc"), SegmentedJournal(directory, "station", 1 << 20),
+                          str(tmp_path / "index.enc"))
+    storage.save([make_test("first", test_id=1), make_test("second", test_id=2)])
+    storage.add_results([(2, degree("journaled"))])
+    seen = storage.seen
+
+    test = storage.load_test(2)
+    assert test.id == 2
+    assert isinstance(test.questions, tuple) and isinstance(test.questions[0].answers, tuple)  # shared as they are
+    assert [d.name for d in test.student_degrees] == ["second", "journaled"]
+    assert storage.seen is seen
+
+
+def sharded(tmp_path) -> ShardedStorage:
+    return ShardedStorage(str(tmp_path), ResultsJournal(str(tmp_path / "results.jnl"), 1 << 20))
+
+
+def test_sharded_load_skips_an_unreadable_shard(tmp_path):
+    storage = sharded(tmp_path)
+    storage.save([make_test("first", test_id=i) for i in range(3)])
+    with open(storage.shard_path(1), "wb") as f:
+        f.write(b"garbled")
+
+    storage = sharded(tmp_path)
+    tests = storage.load()
+    assert [test.id for test in tests] == [0, 2]
+    assert storage.unreadable == {1}
+
+    storage.save(tests, [0])  # it's kept, to be fixed
+    assert [entry["id"] for entry in storage._manifest()] == [0, 2, 1]
+    with open(storage.shard_path(1), "rb") as f:
+        assert f.read() == b"garbled"
+
+
+def test_sharded_crash_before_the_journal_is_emptied(tmp_path, monkeypatch):
+    storage = sharded(tmp_path)
+    storage.save([make_test("first")])
+    storage.add_results([(1, degree("journaled"))])
+
+    def crash(results):
+        raise OSError("crashed")
+
+    monkeypatch.setattr(storage.journal, "rewrite", crash)
+    with pytest.raises(OSError):
+        storage.compact()  # the manifest is written, the journal still holds the result
+
+    storage = sharded(tmp_path)
+    test, = storage.load()
+    assert [d.name for d in test.student_degrees] == ["first", "journaled"]
+    storage.compact()
+    storage.add_results([(1, degree("later"))])
+    test, = sharded(tmp_path).load()
+    assert [d.name for d in test.student_degrees] == ["first", "journaled", "later"]
+
+
+def test_sharded_save_of_a_stale_copy_keeps_the_results_journaled_since(tmp_path):
+    storage = sharded(tmp_path)
+    storage.save([make_test("first", "second")])
+    storage.add_results([(1, degree("before"))])
+
+    loaded, = storage.load()
+    storage.add_results([(1, degree("station"))])  # submitted while it's edited
+
+    working, changes = loaded.student_degrees.copy(), ChangeLog(len(loaded.student_degrees))
+    del working[1]
+    changes.removed(1)
+    deltas = {1: changes.apply(working, loaded.student_degrees)}
+    storage.save([loaded._replace(name="Renamed")], [1], deltas)
+
+    test, = sharded(tmp_path).load()
+    assert test.name == "Renamed"
+    assert [d.name for d in test.student_degrees] == ["first", "before", "station"]
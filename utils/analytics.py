@@ -0,0 +1,88 @@
+from collections import namedtuple
+from typing import List
+
+import numpy as np
+
+from .results import ResultColumns, _Bitsets, _Codes
+
+# every per-question field is an array with a value a question, `discrimination` is nan with less than two results
+QuestionStats = namedtuple("QuestionStats", "difficulty discrimination omission failure")
+GroupStats = namedtuple("GroupStats", "name count mean")
+# `histogram` is (counts, edges) of the percentages, `schools` and `grades` lists of `GroupStats`
+TestStats = namedtuple("TestStats", "count mean median std histogram questions schools grades")
+
+# the share of the results (best and worst) the discrimination index compares, the usual 27%
+DISCRIMINATION_GROUP = 0.27
+
+
+def _matrix(bits: _Bitsets, rows: int, questions: int) -> np.ndarray:
+    """The packed bitsets of a column as a rows x questions boolean matrix."""
+    matrix = np.zeros((rows, questions), dtype=bool)
+    if bits.width and rows:
+        unpacked = np.unpackbits(np.frombuffer(bits.data, dtype=np.uint8).reshape(rows, bits.width), axis=1,
+                                 bitorder="little")
+        n = min(questions, unpacked.shape[1])
+        matrix[:, :n] = unpacked[:, :n]
+    return matrix
+
+
+def _groups(codes: _Codes, percents: np.ndarray) -> List[GroupStats]:
+    column = np.frombuffer(codes.column, dtype=np.uint32)
+    counts = np.bincount(column, minlength=len(codes.values))
+    sums = np.bincount(column, weights=percents, minlength=len(codes.values))
+    # a value's code stays in the table after the last row that had it is edited, those have no results
+    return sorted((GroupStats(codes.values[c], int(counts[c]), float(sums[c] / counts[c]))
+                   for c in np.flatnonzero(counts)), key=lambda group: group.name)
+
+
+def analyze(results: ResultColumns, questions: int, bins: int = 10) -> TestStats:
+    """
+    Item analysis of `results` for a test of `questions` questions, worked out straight from the columns.
+
+    A question's difficulty is the share of the results that got (some) credit for it, its omission and failure
+    rates the shares that left it and got nothing for it, and its discrimination how much more the best 27% of
+    the results got credit for it than the worst 27% did. The degrees are compared as percentages of `out_of`,
+    what a test is out of can change between results.
+    """
+    n = len(results)
+    degrees = np.frombuffer(results.degrees, dtype=np.float64)
+    out_ofs = np.frombuffer(results.out_ofs, dtype=np.float64)
+    percents = np.divide(degrees * 100, out_ofs, out=np.zeros(n), where=out_ofs > 0)
+
+    left = _matrix(results.left, n, questions)
+    failed = _matrix(results.failed_at, n, questions)
+    credited = ~(left | failed)
+
+    if n >= 2:
+        size = max(1, int(round(n * DISCRIMINATION_GROUP)))
+        order = np.argsort(percents, kind="stable")
+        discrimination = credited[order[-size:]].mean(axis=0) - credited[order[:size]].mean(axis=0)
+    else:
+        discrimination = np.full(questions, np.nan)
+
+    mean = (lambda a: a.mean(axis=0)) if n else (lambda a: np.zeros(a.shape[1]))
+    question_stats = QuestionStats(mean(credited), discrimination, mean(left), mean(failed))
+
+    return TestStats(n,
+                     float(percents.mean()) if n else 0.0,
+                     float(np.median(percents)) if n else 0.0,
+                     float(percents.std()) if n else 0.0,
+                     np.histogram(percents, bins=bins, range=(0, 100)),
+                     question_stats,
+                     _groups(results.schools, percents),
+                     _groups(results.grades, percents))
+
+
+class StatsCache(object):
+    """The `TestStats` of some results, worked out again only once they (or the number of questions) change."""
+
+    def __init__(self) -> None:
+        self._key = None  # what `_stats` were worked out of
+        self._stats = None
+
+    def get(self, results: ResultColumns, questions: int) -> TestStats:
+        key = (id(results), results.version, questions)
+        if key != self._key:
+            self._stats = analyze(results, questions)
+            self._key = key
+        return self._stats
@@ -0,0 +1,109 @@
+import hashlib
+import json
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from .helpers import Test
+from .results import ResultColumns
+
+# a response to a question is a bitmask of the answers checked, so no more than that many answers a question
+MAX_ANSWERS = 64
+
+
+def response_mask(checked: Iterable[int]) -> int:
+    """The bitmask of the answers at `checked` (indices into the question's answers, in the order they're stored)."""
+    mask = 0
+    for i in checked:
+        mask |= 1 << i
+    return mask
+
+
+def fingerprint(test: Test) -> str:
+    """
+    Tells what responses to `test` are recorded against: its questions and their answers, in order. Which answers
+    are valid isn't part of it, that's what regrading is for. A response recorded against another fingerprint
+    can't be graded with this one, its bits may stand for other answers.
+    """
+    digest = hashlib.sha256()
+    for question in test.questions:
+        digest.update(json.dumps([question.string, [answer.string for answer in question.answers]]).encode())
+    return digest.hexdigest()[:16]
+
+
+class AnswerKey(object):
+    """The valid answers of every question of a test as a bitmask each, and what a question is worth."""
+
+    def __init__(self, test: Test) -> None:
+        if any(len(question.answers) > MAX_ANSWERS for question in test.questions):
+            raise ValueError("a question can't have more than {} answers".format(MAX_ANSWERS))
+
+        self.valid = np.array([response_mask(i for i, a in enumerate(question.answers) if a.valid)
+                               for question in test.questions], dtype=np.uint64)
+        self.counts = np.bitwise_count(self.valid)
+        # a question with one valid answer is answered with a radio button, it's either right or wrong
+        self.single = self.counts == 1
+        self.full_degree = test.degree / max(len(test.questions), 1)
+        self.fingerprint = fingerprint(test)
+
+    def __len__(self) -> int:
+        return len(self.valid)
+
+
+class Grades(object):
+    """
+    The grades of a batch of responses: `scores` of every question (rows are the responses, columns the
+    questions), `left` and `failed` (no credit for what's answered) masks the same shape, and the `totals`.
+    """
+
+    def __init__(self, scores: np.ndarray, left: np.ndarray, failed: np.ndarray) -> None:
+        self.scores = scores
+        self.left = left
+        self.failed = failed
+        self.totals = scores.sum(axis=1)
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def left_at(self, row: int) -> List[int]:
+        return np.flatnonzero(self.left[row]).tolist()
+
+    def failed_at(self, row: int) -> List[int]:
+        return np.flatnonzero(self.failed[row]).tolist()
+
+
+def grade(key: AnswerKey, responses: Sequence[Sequence[int]]) -> Grades:
+    """
+    Grades all of `responses` at once, a response being the bitmask of the answers checked in every question
+    (0 for one that's left). A multi-answer question gets the share of its valid answers that were checked,
+    checking more answers than the valid ones isn't possible in the tester.
+    """
+    responses = np.asarray(responses, dtype=np.uint64).reshape(-1, len(key))
+
+    left = responses == 0
+    hits = np.bitwise_count(responses & key.valid)
+    scores = np.where(key.single,
+                      np.where(responses == key.valid, key.full_degree, 0.0),
+                      hits * key.full_degree / np.maximum(key.counts, 1))
+    scores[left] = 0.0
+    return Grades(scores, left, ~left & (scores == 0))
+
+
+def regrade(key: AnswerKey, results: ResultColumns) -> Tuple[np.ndarray, Grades, int]:
+    """
+    Grades the responses stored with `results` again against `key`, all in one batch. Only the results recorded
+    against the same questions (their fingerprint is the key's) can be, or, for those from before the
+    fingerprints were kept, the ones with a response for every question (older ones have none). The rows of
+    those are returned with their grades, and how many results were left out for being recorded against other
+    questions.
+    """
+    ends = np.frombuffer(results.responses.ends, dtype=np.uint32).astype(np.intp)
+    starts = np.concatenate(([0], ends[:-1]))
+    codes = np.frombuffer(results.fingerprints.column, dtype=np.uint32)
+    fingerprints = np.array(results.fingerprints.values, dtype=object)[codes]
+    same, unknown = fingerprints == key.fingerprint, fingerprints == ""
+    rows = np.flatnonzero((same | unknown) & (ends - starts == len(key)))
+
+    data = np.frombuffer(results.responses.data, dtype=np.uint64)
+    responses = data[starts[rows, None] + np.arange(len(key))] if len(rows) else np.empty((0, len(key)), np.uint64)
+    return rows, grade(key, responses), int(np.count_nonzero(~(same | unknown)))
@@ -1,8 +1,13 @@
 import base64
 import datetime
 import os
+import socket
 import sys
-from collections import namedtuple
+import tempfile
+import threading
+import time
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager, suppress
 
 import aenum
 from PyQt4 import QtGui
@@ -18,39 +23,71 @@ from .vals import (
 Answer = namedtuple("Answer", "string valid")
 Question = namedtuple("Question", "string pic answers")
 Test = namedtuple("Test", "id name description time questions degree student_degrees")
-StudentDegree = namedtuple("StudentDegree", "name phone school grade degree out_of failed_at left")
+StudentDegree = namedtuple("StudentDegree",
+                           "name phone school grade degree out_of failed_at left responses fingerprint")
+# what was checked in every question as a bitmask of the answers (by their place in it), and the fingerprint of the
+# questions they were recorded against (see `grading.fingerprint`), results from before they were kept have none
+StudentDegree.__new__.__defaults__ = ((), "")
+TestSummary = namedtuple("TestSummary", "id name description time degree questions")  # `questions` is a count
+
+
+def summarize(test: Test) -> TestSummary:
+    return TestSummary(test.id, test.name, test.description, test.time, test.degree, len(test.questions))
 
 
 class Encryptor(object):
+    """
+    Fernet encryption keyed by a PBKDF2 derivation of `p`.
+
+    The output is `salt + token`. Deriving a key is deliberately slow, so keys are cached per salt and every
+    write of the process reuses one salt (the first one read or generated); the random IV inside each Fernet
+    token is the per-write nonce.
+    """
     p = base64.b64decode(b'ZnVja3k0MmZ1bmt5NDJmdWM0Mmtpbmc0MndvcmxkNDI=')
+    iterations = 100000
+    cache_size = 8
+
+    _keys = OrderedDict()  # type: OrderedDict
+    _salt = None  # bytes, once there is one
+    _lock = threading.Lock()
+
+    @classmethod
+    def fernet(cls, salt: bytes) -> Fernet:
+        with cls._lock:
+            fer = cls._keys.get(salt)
+            if fer is not None:
+                cls._keys.move_to_end(salt)
+                return fer
 
-    @staticmethod
-    def encrypt(string: str) -> bytes:
-        s = os.urandom(16)
         kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
             length=32,
-            salt=s,
-            iterations=100000,
+            salt=salt,
+            iterations=cls.iterations,
             backend=default_backend()
         )
-        key = base64.urlsafe_b64encode(kdf.derive(Encryptor.p))
-        fer = Fernet(key)
-        return s + fer.encrypt(string.encode())
+        fer = Fernet(base64.urlsafe_b64encode(kdf.derive(cls.p)))
+
+        with cls._lock:
+            cls._keys[salt] = fer
+            while len(cls._keys) > cls.cache_size:
+                cls._keys.popitem(last=False)
+        return fer
+
+    @classmethod
+    def encrypt(cls, string: str) -> bytes:
+        if cls._salt is None:
+            cls._salt = os.urandom(16)
+        s = cls._salt
+        return s + cls.fernet(s).encrypt(string.encode())
 
-    @staticmethod
-    def decrypt(data: bytes) -> str:
+    @classmethod
+    def decrypt(cls, data: bytes) -> str:
         s = data[:16]
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=s,
-            iterations=100000,
-            backend=default_backend()
-        )
-        key = base64.urlsafe_b64encode(kdf.derive(Encryptor.p))
-        fer = Fernet(key)
-        return fer.decrypt(data[16:]).decode()
+        string = cls.fernet(s).decrypt(data[16:]).decode()
+        if cls._salt is None:
+            cls._salt = s  # the salt the data was written with becomes the one for our writes
+        return string
 
 
 class ReasonFlag(str, aenum.Flag, settings=(aenum.AutoValue,)):
@@ -104,6 +141,96 @@ def res(name: str, kind="image") -> str:
         return os.path.join(DATA_PATH, name)
 
 
+@contextmanager
+def atomic_open(path: str, mode="wb", **kwargs):
+    """
+    Opens a temporary file beside `path` that replaces it once it's closed without an error, so whoever reads
+    `path` (or a crash halfway through) only ever sees the old file or the whole new one.
+    """
+    fd, tmp = tempfile.mkstemp(".tmp", os.path.basename(path) + ".", os.path.dirname(path) or ".")
+    try:
+        with open(fd, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        with suppress(OSError):
+            os.remove(tmp)
+        raise
+
+
+class LockFile(object):
+    """
+    A lock between processes, even on other machines sharing the folder: it's held by whoever managed to create
+    `path`. One older than `stale` seconds is taken to be left by a crash and broken (see `_break_stale`).
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0, stale: float = 120.0) -> None:
+        self.path = path
+        self.timeout = timeout
+        self.stale = stale
+
+    def acquire(self, timeout: float = None) -> bool:
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        delay = 0.005
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self._break_stale():
+                    continue
+            else:
+                os.write(fd, "{} {}".format(socket.gethostname(), os.getpid()).encode())
+                os.close(fd)
+                return True
+
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
+    def _is_stale(self, path: str) -> bool:
+        try:
+            return time.time() - os.path.getmtime(path) > self.stale
+        except OSError:
+            return False
+
+    def _break_stale(self) -> bool:
+        """
+        Breaks the lock if it's stale, True if it did. It's renamed aside (under a name of its own) first, so of
+        everyone finding it stale at once only one gets it, and then looked at again: if it's a lock just taken by
+        whoever broke the stale one before, it's put back (unless someone took the lock since).
+        """
+        if not self._is_stale(self.path):
+            return False
+        aside = "{}.{}-{}-{}.stale".format(self.path, socket.gethostname(), os.getpid(), os.urandom(4).hex())
+        try:
+            os.replace(self.path, aside)
+        except OSError:  # someone else got it first
+            return False
+
+        stale = self._is_stale(aside)
+        if not stale:
+            with suppress(OSError):
+                os.link(aside, self.path)
+        with suppress(OSError):
+            os.remove(aside)
+        return stale
+
+    def release(self) -> None:
+        with suppress(OSError):
+            os.remove(self.path)
+
+    def __enter__(self) -> "LockFile":
+        if not self.acquire():
+            raise TimeoutError("Couldn't lock " + self.path)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
 def _init():
     req_files = [
         ("data.enc", "state"),
@@ -120,10 +247,12 @@ def _defer():
         os.remove("qt.conf")
 
 
-def tab_repr(index: int, deleted=False) -> str:
-    if index == 0:
-        return "Details"
-    if index == 1:
-        return "Degrees"
+# the tabs of a test in the editor before its questions', they can't be closed nor moved
+FIXED_TABS = ("Details", "Degrees", "Statistics")
+
+
+def tab_repr(index: int) -> str:
+    if index < len(FIXED_TABS):
+        return FIXED_TABS[index]
 
-    return "Q " + str(index - 1) + (" (Deleted)" if deleted else "")
+    return "Q " + str(index - len(FIXED_TABS) + 1)
@@ -0,0 +1,206 @@
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from PyQt4 import QtGui, QtCore
+
+from .helpers import atomic_open
+from .vals import IMAGES_PATH, IMAGE_CACHE_SIZE, IMAGE_MAX_SIZE, IMAGE_THUMB_SIZE
+
+
+def _decode(path: str, max_size: Tuple[int, int]) -> QtGui.QImage:
+    """Reads an image scaled down (if it has to be) to fit in `max_size`, it's safe off the gui thread."""
+    reader = QtGui.QImageReader(path)
+    size = reader.size()
+    bound = QtCore.QSize(*max_size)
+    if size.isValid() and (size.width() > bound.width() or size.height() > bound.height()):
+        reader.setScaledSize(size.scaled(bound, QtCore.Qt.KeepAspectRatio))
+    return reader.read()
+
+
+def _cost(image) -> int:
+    return image.width() * image.height() * max(image.depth(), 8) // 8
+
+
+class ImageCache(QtCore.QObject):
+    """
+    Decoded images shared by the whole app, bounded by their size in bytes (least recently used ones go first).
+    They're keyed by path and modification time so an image that's replaced on disk is read again once it's
+    prefetched again: the file is only looked at then (and the first time it's asked for), not on every `get`.
+
+    `prefetch` decodes on worker threads (and `loaded` tells when it's done), `get` (on the gui thread) turns
+    what's decoded into a `QPixmap`.
+    """
+
+    def __init__(self, max_bytes: int = IMAGE_CACHE_SIZE, max_size: Tuple[int, int] = IMAGE_MAX_SIZE,
+                 workers: int = 2) -> None:
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.max_size = max_size
+        self._entries = OrderedDict()  # type: OrderedDict  # (path, mtime) -> QImage or QPixmap
+        self._bytes = 0
+        self._pending = {}  # key -> the future decoding it
+        self._keys = {}  # path -> its key when it was last prefetched, None if it wasn't there
+        self._unreadable = set()  # keys of the images that couldn't be decoded
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(workers)
+
+    @staticmethod
+    def _key(path: str) -> Optional[tuple]:
+        try:
+            return path, os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _put(self, key: tuple, image) -> None:
+        # with the lock held
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= _cost(old)
+        self._entries[key] = image
+        self._bytes += _cost(image)
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, dropped = self._entries.popitem(last=False)
+            self._bytes -= _cost(dropped)
+
+    def _load(self, key: tuple) -> None:
+        image = _decode(key[0], self.max_size)
+        with self._lock:
+            self._pending.pop(key, None)
+            if image.isNull():
+                self._unreadable.add(key)
+            else:
+                self._put(key, image)
+        self.loaded.emit(key[0])
+
+    def _cached_key(self, path: str) -> Optional[tuple]:
+        with self._lock:
+            if path in self._keys:
+                return self._keys[path]
+        key = self._key(path)
+        with self._lock:
+            return self._keys.setdefault(path, key)
+
+    def submit(self, fn, *args) -> None:
+        """Runs `fn(*args)` on the workers, for work on images that shouldn't hold the gui up either."""
+        self._pool.submit(fn, *args)
+
+    def prefetch(self, path: str) -> None:
+        key = self._key(path)
+        with self._lock:
+            self._keys[path] = key
+        if key is None:
+            return
+        with self._lock:
+            cached = key in self._entries
+            if not cached and key not in self._pending:
+                self._pending[key] = self._pool.submit(self._load, key)
+        if cached:
+            self.loaded.emit(path)
+
+    def get(self, path: str, wait: bool = True) -> Optional[QtGui.QPixmap]:
+        """
+        The image at `path`, None if it can't be read. One that isn't decoded (it wasn't prefetched, or it was
+        dropped since) is decoded now if it's to `wait` for, otherwise None is given back while the workers decode
+        it (`loaded` is emitted once they have), so painting never decodes on the gui thread.
+        """
+        key = self._cached_key(path)
+        if key is None:
+            return None
+
+        with self._lock:
+            if key in self._unreadable:
+                return None
+            image = self._entries.get(key)
+            pending = None
+            if image is not None:
+                self._entries.move_to_end(key)
+            elif not wait:
+                if key not in self._pending:
+                    self._pending[key] = self._pool.submit(self._load, key)
+                return None
+            else:
+                pending = self._pending.get(key)
+
+        if pending is not None:
+            pending.result()
+            with self._lock:
+                image = self._entries.get(key)
+        if image is None:
+            image = _decode(path, self.max_size)
+            if image.isNull():
+                return None
+
+        if isinstance(image, QtGui.QImage):
+            image = QtGui.QPixmap.fromImage(image)
+            with self._lock:
+                self._put(key, image)
+        return image
+
+    # emitted with the path of every prefetched image once it's decoded, from a worker thread (or the one
+    # prefetching it, if it already was)
+    loaded = QtCore.pyqtSignal(str, name="loaded")
+
+
+class ImageStore(object):
+    """
+    The pictures of questions, under res/images named by the sha256 of their content so the same picture is
+    kept once however many questions use it. A thumbnail of each is made once, in res/images/thumbs, it's safe
+    to make them off the gui thread.
+    """
+
+    def __init__(self, directory: str = IMAGES_PATH, thumb_size: Tuple[int, int] = IMAGE_THUMB_SIZE) -> None:
+        self.directory = directory
+        self.thumbs = os.path.join(directory, "thumbs")
+        self.thumb_size = thumb_size
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def import_image(self, path: str) -> str:
+        """Copies the image at `path` in (unless it's there already) and gives back the name it's stored under."""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b""):
+                digest.update(chunk)
+
+        name = digest.hexdigest() + os.path.splitext(path)[1].lower()
+        target = self.path(name)
+        if not os.path.isfile(target):
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path, "rb") as src, atomic_open(target) as dst:
+                shutil.copyfileobj(src, dst)
+        return name
+
+    def thumb_path(self, name: str) -> str:
+        return os.path.join(self.thumbs, name + ".png")
+
+    def thumbnail(self, name: str) -> str:
+        """The path of the thumbnail of `name`, made now if it wasn't (or the image itself if it can't be)."""
+        thumb = self.thumb_path(name)
+        if not os.path.isfile(thumb):
+            image = _decode(self.path(name), self.thumb_size)
+            if image.isNull():
+                return self.path(name)
+
+            buffer = QtCore.QBuffer()
+            buffer.open(QtCore.QIODevice.WriteOnly)
+            if not image.save(buffer, "PNG"):
+                return self.path(name)
+            os.makedirs(self.thumbs, exist_ok=True)
+            # a temporary file of its own, whoever else is making the same thumbnail at once doesn't get in the way
+            with atomic_open(thumb) as f:
+                f.write(buffer.data().data())
+        return thumb
+
+    def prefetch_thumbnail(self, name: str, cache: ImageCache) -> None:
+        """Makes the thumbnail of `name` (if it wasn't) and prefetches it into `cache`, both on its workers."""
+        cache.submit(lambda: cache.prefetch(self.thumbnail(name)))
+
+
+IMAGES = ImageCache()
+STORE = ImageStore()
@@ -0,0 +1,245 @@
+import json
+import os
+import re
+import struct
+import unicodedata
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from cryptography.fernet import InvalidToken
+
+from .helpers import (
+    Encryptor,
+    Test, StudentDegree,
+    atomic_open,
+)
+
+_LENGTH = struct.Struct("<I")
+# a journal record is `Encryptor`'s salt followed by a Fernet token, and a token always starts like this
+_SALT_SIZE = 16
+_TOKEN_START = b"gAAAAA"
+
+
+def write_record(f: BinaryIO, data: bytes) -> None:
+    f.write(_LENGTH.pack(len(data)) + data)
+
+
+def read_records(f: BinaryIO) -> Iterator[bytes]:
+    while True:
+        head = f.read(_LENGTH.size)
+        if len(head) < _LENGTH.size:
+            return
+        length, = _LENGTH.unpack(head)
+        data = f.read(length)
+        if len(data) < length:  # torn write at the tail, nothing after it is trustworthy
+            return
+        yield data
+
+
+class ResultsJournal(object):
+    """
+    Append-only, encrypted log of the results recorded since the last snapshot of the tests was written.
+
+    Every record is one Fernet token (so it's authenticated on its own) holding the id of the test and the
+    `StudentDegree`, submitting a result costs one small append whatever the size of the bank.
+
+    A crash halfway through an append leaves a torn record at the end. The first append of a process cuts it off
+    (`repair`), and reading carries on past a record it can't read to the next one that can be, so nothing
+    appended after one is lost.
+    """
+
+    _repaired = set()  # the (absolute) paths repaired by this process
+
+    def __init__(self, path: str, threshold: int) -> None:
+        self.path = path
+        self.threshold = threshold
+
+    def append(self, test_id: int, degree: StudentDegree) -> None:
+        self.extend([(test_id, degree)])
+
+    def extend(self, results: Iterable[Tuple[int, StudentDegree]]) -> None:
+        """Appends a batch of results with a single write (and sync), it's either all written or none of it."""
+        if os.path.abspath(self.path) not in self._repaired:
+            self.repair()
+
+        data = self._encode(results)
+        with open(self.path, "ab", buffering=0) as f:
+            start = os.fstat(f.fileno()).st_size
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[f.write(view):]
+                os.fsync(f.fileno())
+            except BaseException:
+                os.ftruncate(f.fileno(), start)
+                raise
+
+    def rewrite(self, results: Iterable[Tuple[int, StudentDegree]]) -> None:
+        """Replaces the whole journal with `results` at once."""
+        with atomic_open(self.path) as f:
+            f.write(self._encode(results))
+        self._repaired.add(os.path.abspath(self.path))
+
+    @staticmethod
+    def _encode(results: Iterable[Tuple[int, StudentDegree]]) -> bytearray:
+        data = bytearray()
+        for test_id, degree in results:
+            record = Encryptor.encrypt(unicodedata.normalize("NFKD", json.dumps({"test": test_id,
+                                                                                 "degree": degree._asdict()})))
+            data += _LENGTH.pack(len(record)) + record
+        return data
+
+    def repair(self) -> None:
+        """Cuts off whatever is after the last record that can be read, a record torn by a crash."""
+        _, end = self.read()
+        if self.size > end:
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+        self._repaired.add(os.path.abspath(self.path))
+
+    @staticmethod
+    def _decode(data: bytes) -> Optional[Tuple[int, StudentDegree]]:
+        try:
+            record = json.loads(unicodedata.normalize("NFKD", Encryptor.decrypt(data)))
+            return record["test"], StudentDegree(**record["degree"])
+        except (InvalidToken, ValueError, KeyError, TypeError):
+            return None
+
+    def read(self, start: int = 0) -> Tuple[List[Tuple[int, StudentDegree]], int]:
+        """The records after offset `start` and the offset right after the last of them."""
+        records, end = [], start
+        if not os.path.isfile(self.path):
+            return records, end
+
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            data = f.read()
+
+        pos = 0
+        while pos + _LENGTH.size <= len(data):
+            length, = _LENGTH.unpack_from(data, pos)
+            body = pos + _LENGTH.size
+            record = self._decode(data[body:body + length]) if body + length <= len(data) else None
+            if record is not None:
+                records.append(record)
+                pos = body + length
+                end = start + pos
+                continue
+            # torn or garbled, the next record (if there's one) starts where the next token does
+            token = data.find(_TOKEN_START, body + _SALT_SIZE + 1)
+            if token < 0:
+                break
+            pos = token - _SALT_SIZE - _LENGTH.size
+        return records, end
+
+    def records(self) -> Iterator[Tuple[int, StudentDegree]]:
+        return iter(self.read()[0])
+
+    def replay(self, tests: List[Test]) -> int:
+        return _replay(tests, self.records())
+
+    def clear(self) -> None:
+        if os.path.isfile(self.path):
+            with open(self.path, "wb"):
+                pass
+
+    @property
+    def size(self) -> int:
+        return os.path.getsize(self.path) if os.path.isfile(self.path) else 0
+
+    @property
+    def needs_compaction(self) -> bool:
+        return self.size >= self.threshold
+
+
+def _replay(tests: List[Test], records: Iterable[Tuple[int, StudentDegree]]) -> int:
+    by_id = {test.id: test for test in tests}
+    n = 0
+    for test_id, degree in records:
+        test = by_id.get(test_id)
+        if test is not None:
+            test.student_degrees.append(degree)
+            n += 1
+    return n
+
+
+class SegmentedJournal(object):
+    """
+    The results journaled by every station (a copy of the app running over the same, maybe shared, state folder)
+    at once. A station only ever appends to segments of its own, results-<station>-<n>.jnl, so no two write the
+    same file, and a snapshot keeps how far into each segment it has read (its watermarks).
+
+    A station moves on to a new segment once its current one is all in a snapshot, and removes its old ones
+    once every snapshot kept holds them whole. Other stations' segments are left alone.
+
+    Every segment is a `ResultsJournal`, read past a torn or garbled record like one. A station cuts a torn
+    record off the end of its current segment (the only one it appends to) as it opens it.
+    """
+
+    _name = re.compile(r"^results(?:-(?P<station>.+)-(?P<n>\d+))?\.jnl$")
+
+    def __init__(self, directory: str, station: str, threshold: int) -> None:
+        self.directory = directory
+        self.station = re.sub(r"[^\w.]", "_", station)
+        self.threshold = threshold
+        self._journals = {}  # type: Dict[str, ResultsJournal]
+        own = [n for name, station, n in self._segments() if station == self.station]
+        self.current = max(own, default=0)
+        self._journal(self.current_name).repair()
+
+    def _segments(self) -> List[Tuple[str, Optional[str], int]]:
+        segments = []
+        for name in sorted(os.listdir(self.directory)):
+            match = self._name.match(name)
+            if match:
+                segments.append((name, match.group("station"), int(match.group("n") or 0)))
+        return segments
+
+    def _journal(self, name: str) -> ResultsJournal:
+        journal = self._journals.get(name)
+        if journal is None:
+            journal = self._journals[name] = ResultsJournal(os.path.join(self.directory, name), self.threshold)
+        return journal
+
+    @property
+    def current_name(self) -> str:
+        return "results-{}-{}.jnl".format(self.station, self.current)
+
+    def append(self, test_id: int, degree: StudentDegree) -> None:
+        self._journal(self.current_name).append(test_id, degree)
+
+    def extend(self, results: Iterable[Tuple[int, StudentDegree]]) -> None:
+        self._journal(self.current_name).extend(results)
+
+    def read(self, watermarks: Dict[str, int]) -> Tuple[List[Tuple[int, StudentDegree]], Dict[str, int]]:
+        """The records of every segment past `watermarks`, and the watermarks after them."""
+        records, new_watermarks = [], {}
+        for name, _, _ in self._segments():
+            segment_records, new_watermarks[name] = self._journal(name).read(watermarks.get(name, 0))
+            records.extend(segment_records)
+        return records, new_watermarks
+
+    def replay(self, tests: List[Test], watermarks: Dict[str, int]) -> Dict[str, int]:
+        records, watermarks = self.read(watermarks)
+        _replay(tests, records)
+        return watermarks
+
+    def roll(self, snapshots: List[Dict[str, int]]) -> None:
+        """
+        Called once a snapshot is written (with the watermarks of it and of the other snapshots kept, in
+        `snapshots`), moves on from the current segment if it's all in the snapshot and removes the old ones
+        that are in all of them.
+        """
+        current = self._journal(self.current_name)
+        if current.size and snapshots[0].get(self.current_name) == current.size:
+            self.current += 1
+
+        for name, station, n in self._segments():
+            if station == self.station and n < self.current or station is None:  # None: from before stations
+                size = self._journal(name).size
+                if all(watermarks.get(name) == size for watermarks in snapshots):
+                    os.remove(os.path.join(self.directory, name))
+                    self._journals.pop(name, None)
+
+    def needs_compaction(self, watermarks: Dict[str, int]) -> bool:
+        """Whether this station has journaled `threshold` bytes past `watermarks` (of the latest snapshot)."""
+        return self._journal(self.current_name).size - watermarks.get(self.current_name, 0) >= self.threshold
@@ -1,48 +1,231 @@
+import hashlib
 import json
+import struct
 import unicodedata
-from typing import List
+from typing import BinaryIO, Callable, Iterable, Iterator, List, Optional
 
 from .helpers import (
     Encryptor,
-    Test, Question, Answer, StudentDegree
+    Test, Question, Answer, StudentDegree,
+    atomic_open,
 )
+from .journal import (
+    ResultsJournal,
+    read_records, write_record,
+)
+from .results import ResultColumns
+
+# first bytes of the encrypted files holding a record per test (instead of a single token)
+STREAM_MAGIC = b"EXS1"
+# snapshots start with it and a header of their generation and the sha256 of everything after the header, then
+# a record of what else is known about the snapshot (see `snapshot_meta`) before the tests
+SNAPSHOT_MAGIC = b"EXS2"
+_SNAPSHOT_HEADER = struct.Struct("<Q32s")
+
+
+class _HashingWriter(object):
+    def __init__(self, f: BinaryIO) -> None:
+        self.f = f
+        self.digest = hashlib.sha256()
+
+    def write(self, data: bytes) -> None:
+        self.digest.update(data)
+        self.f.write(data)
+
+
+def _snapshot_header(f: BinaryIO) -> Optional[tuple]:
+    if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+        return None
+    header = f.read(_SNAPSHOT_HEADER.size)
+    return _SNAPSHOT_HEADER.unpack(header) if len(header) == _SNAPSHOT_HEADER.size else None
+
+
+def snapshot_generation(infile: str) -> int:
+    """The generation of the snapshot written by `dump_tests`, 0 for files from before generations."""
+    with open(infile, "rb") as f:
+        header = _snapshot_header(f)
+    return header[0] if header else 0
+
+
+def snapshot_meta(infile: str) -> dict:
+    """What was given as `meta` to `dump_tests` when writing the snapshot, nothing for older files."""
+    with open(infile, "rb") as f:
+        if _snapshot_header(f) is None:
+            return {}
+        for record in read_records(f):
+            return json.loads(Encryptor.decrypt(record))
+    return {}
+
+
+def verify_snapshot(infile: str) -> bool:
+    """
+    Whether the snapshot is whole, by its checksum. Files from before checksums can only be told apart by
+    failing to decrypt, so they pass if they aren't empty.
+    """
+    with open(infile, "rb") as f:
+        header = _snapshot_header(f)
+        if header is None:
+            f.seek(0)
+            head = f.read(len(SNAPSHOT_MAGIC))
+            return bool(head) and head != SNAPSHOT_MAGIC  # not a torn header of a snapshot
+
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest() == header[1]
+
+
+def snapshot_offsets(infile: str) -> List[int]:
+    """Where the record of every test of a snapshot starts, in the order of the tests (nothing is decrypted)."""
+    offsets = []
+    with open(infile, "rb") as f:
+        if _snapshot_header(f) is None:
+            return offsets
+        pos = f.tell()
+        for i, _ in enumerate(read_records(f)):
+            if i:  # not the meta record
+                offsets.append(pos)
+            pos = f.tell()
+    return offsets
+
 
+def read_snapshot_test(infile: str, offset: int) -> Test:
+    """The test whose record starts at `offset` (one of `snapshot_offsets`) in a snapshot."""
+    with open(infile, "rb") as f:
+        f.seek(offset)
+        record = next(read_records(f), None)
+    if record is None:
+        raise ValueError("No test at {} of {}".format(offset, infile))
+    return test_from_dict(json.loads(unicodedata.normalize("NFKD", Encryptor.decrypt(record))))
 
-def parse_tests(infile: str, encrypted=False) -> List[Test]:
-    with open(infile, "rb") if encrypted else open(infile, encoding="utf8") as f:
-        contents = f.read()
+
+def test_from_dict(test: dict) -> Test:
+    # the questions and their answers are tuples, so a loaded test's can be shared (by the editor) as they are
+    final_questions = []
+    for question in test["questions"]:
+        question["answers"] = tuple(Answer(**ans) for ans in question["answers"])
+        final_questions.append(Question(**question))
+    test["questions"] = tuple(final_questions)
+    test["student_degrees"] = ResultColumns(StudentDegree(**s) for s in test["student_degrees"])
+    return Test(**test)
+
+
+def test_to_dict(test: Test) -> dict:
+    test_dict = test._asdict()
+    final_questions = []
+    for question in test_dict["questions"]:
+        question_dict = question._asdict()
+        final_answers = [ans._asdict() for ans in question_dict["answers"]]
+        question_dict["answers"] = final_answers
+        final_questions.append(question_dict)
+    test_dict["questions"] = final_questions
+    test_dict["student_degrees"] = [s._asdict() for s in test_dict["student_degrees"]]
+    return test_dict
+
+
+def _iter_json_array(read: Callable[[int], str]) -> Iterator:
+    """Yields the items of a JSON array one by one, `read(n)` gives the next chunk of text ("" at the end)."""
+    decoder = json.JSONDecoder()
+    buf, pos = "", 0
+    started = eof = False
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+
+        if pos < len(buf):
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+            else:
+                if end < len(buf) or eof:  # otherwise it might go on in the next chunk
+                    yield item
+                    pos = end
+                    continue
+        elif eof:
+            if started:
+                raise ValueError("Unterminated JSON array")
+            return
+
+        chunk = read(max(1 << 16, len(buf) - pos))  # doubles what's buffered, big items don't get rescanned much
+        eof = not chunk
+        buf, pos = buf[pos:] + chunk, 0
+
+
+def iter_tests(infile: str, encrypted=False) -> Iterator[Test]:
+    """
+    Reads the tests one at a time. Encrypted files written by `dump_tests` hold one encrypted record per test,
+    files from before that are a single token and are read whole.
+    """
+    if not encrypted:
+        with open(infile, encoding="utf8") as f:
+            for test in _iter_json_array(lambda n: unicodedata.normalize("NFKD", f.read(n))):
+                yield test_from_dict(test)
+        return
+
+    with open(infile, "rb") as f:
+        head = f.read(len(STREAM_MAGIC))
+        records = read_records(f)
+        if head == SNAPSHOT_MAGIC:
+            f.seek(_SNAPSHOT_HEADER.size, 1)
+            next(records, None)  # the meta record
+            head = STREAM_MAGIC  # the rest is laid out the same
+        if head == STREAM_MAGIC:
+            for record in records:
+                yield test_from_dict(json.loads(unicodedata.normalize("NFKD", Encryptor.decrypt(record))))
+            return
+
+        contents = head + f.read()
         if not contents:
-            return []
-        data = unicodedata.normalize("NFKD", Encryptor.decrypt(contents) if encrypted else contents)
-
-    tests = json.loads(data, encoding="utf8")
-    final_tests = []
-    for test in tests:
-        final_questions = []
-        for question in test["questions"]:
-            question["answers"] = [Answer(**ans) for ans in question["answers"]]
-            final_questions.append(Question(**question))
-        test["questions"] = final_questions
-        test["student_degrees"] = [StudentDegree(**s) for s in test["student_degrees"]]
-        final_tests.append(Test(**test))
+            return
+        data = unicodedata.normalize("NFKD", Encryptor.decrypt(contents))
+
+    for test in json.loads(data):
+        yield test_from_dict(test)
+
+
+def parse_tests(infile: str, encrypted=False, journal: ResultsJournal = None) -> List[Test]:
+    final_tests = list(iter_tests(infile, encrypted))
+
+    if journal is not None:
+        journal.replay(final_tests)
 
     return final_tests
 
 
-def dump_tests(tests: List[Test], outfile: str, encrypt=False) -> None:
-    final_tests = []
-    for test in tests:
-        test_dict = test._asdict()
-        final_questions = []
-        for question in test_dict["questions"]:
-            question_dict = question._asdict()
-            final_answers = [ans._asdict() for ans in question_dict["answers"]]
-            question_dict["answers"] = final_answers
-            final_questions.append(question_dict)
-        test_dict["questions"] = final_questions
-        test_dict["student_degrees"] = [s._asdict() for s in test_dict["student_degrees"]]
-        final_tests.append(test_dict)
-
-    with open(outfile, "wb") if encrypt else open(outfile, "w", encoding="utf8") as f:
-        data = unicodedata.normalize("NFKD", json.dumps(final_tests))
-        f.write(Encryptor.encrypt(data) if encrypt else data)
+def dump_tests(tests: Iterable[Test], outfile: str, encrypt=False, journal: ResultsJournal = None,
+               generation: int = 0, meta: dict = None) -> None:
+    """
+    Writes the tests one at a time (`tests` can be a generator), `outfile` is replaced once they're all written.
+    Encrypted files are snapshots with a header telling their `generation` and checksum, and `meta` beside them.
+    """
+    if encrypt:
+        with atomic_open(outfile, "wb") as f:
+            f.write(SNAPSHOT_MAGIC + bytes(_SNAPSHOT_HEADER.size))  # the header is filled in at the end
+            writer = _HashingWriter(f)
+            write_record(writer, Encryptor.encrypt(json.dumps(meta or {})))
+            for test in tests:
+                write_record(writer, Encryptor.encrypt(unicodedata.normalize("NFKD", json.dumps(test_to_dict(test)))))
+            f.seek(len(SNAPSHOT_MAGIC))
+            f.write(_SNAPSHOT_HEADER.pack(generation, writer.digest.digest()))
+    else:
+        with atomic_open(outfile, "w", encoding="utf8") as f:
+            f.write("[")
+            for i, test in enumerate(tests):
+                if i:
+                    f.write(",\n")
+                f.write(unicodedata.normalize("NFKD", json.dumps(test_to_dict(test))))
+            f.write("]")
+
+    if journal is not None:  # the snapshot now holds every journaled result
+        journal.clear()
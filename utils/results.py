@@ -0,0 +1,483 @@
+import threading
+import unicodedata
+from array import array
+from collections import namedtuple
+from collections.abc import MutableSequence
+from typing import Iterable, List
+
+from .helpers import StudentDegree
+
+# a row changed by saving the edits of some results: `old` is None for a row inserted, `new` for one deleted
+ResultChange = namedtuple("ResultChange", "old new")
+
+
+class _Strings(object):
+    """A column of strings packed as utf-8 in one buffer."""
+
+    def __init__(self) -> None:
+        self.data = bytearray()
+        self.ends = array("I")
+
+    def __len__(self) -> int:
+        return len(self.ends)
+
+    def _span(self, i: int) -> tuple:
+        return self.ends[i - 1] if i else 0, self.ends[i]
+
+    def __getitem__(self, i: int) -> str:
+        start, end = self._span(i)
+        return self.data[start:end].decode()
+
+    def insert(self, i: int, s: str) -> None:
+        b = s.encode()
+        start = self.ends[i - 1] if i else 0
+        self.data[start:start] = b
+        self.ends.insert(i, start)
+        self._shift(i, len(b))
+
+    def __setitem__(self, i: int, s: str) -> None:
+        b = s.encode()
+        start, end = self._span(i)
+        self.data[start:end] = b
+        self._shift(i, len(b) - (end - start))
+
+    def __delitem__(self, i: int) -> None:
+        start, end = self._span(i)
+        del self.data[start:end]
+        del self.ends[i]
+        self._shift(i, start - end)
+
+    def _shift(self, i: int, delta: int) -> None:
+        if delta:
+            ends = self.ends
+            for j in range(i, len(ends)):
+                ends[j] += delta
+
+    def append(self, s: str) -> None:
+        self.data += s.encode()
+        self.ends.append(len(self.data))
+
+    def copy(self) -> "_Strings":
+        new = _Strings()
+        new.data, new.ends = bytearray(self.data), self.ends[:]
+        return new
+
+
+class _Vectors(object):
+    """A column of lists of unsigned 64-bit ints (bitmasks) packed in one array, with where every row ends."""
+
+    def __init__(self) -> None:
+        self.data = array("Q")
+        self.ends = array("I")
+
+    def __len__(self) -> int:
+        return len(self.ends)
+
+    def _span(self, i: int) -> tuple:
+        return self.ends[i - 1] if i else 0, self.ends[i]
+
+    def __getitem__(self, i: int) -> List[int]:
+        start, end = self._span(i)
+        return self.data[start:end].tolist()
+
+    def insert(self, i: int, values: Iterable[int]) -> None:
+        values = array("Q", values)
+        start = self.ends[i - 1] if i else 0
+        self.data[start:start] = values
+        self.ends.insert(i, start)
+        self._shift(i, len(values))
+
+    def __setitem__(self, i: int, values: Iterable[int]) -> None:
+        values = array("Q", values)
+        start, end = self._span(i)
+        self.data[start:end] = values
+        self._shift(i, len(values) - (end - start))
+
+    def __delitem__(self, i: int) -> None:
+        start, end = self._span(i)
+        del self.data[start:end]
+        del self.ends[i]
+        self._shift(i, start - end)
+
+    def _shift(self, i: int, delta: int) -> None:
+        if delta:
+            ends = self.ends
+            for j in range(i, len(ends)):
+                ends[j] += delta
+
+    def append(self, values: Iterable[int]) -> None:
+        self.data.extend(values)
+        self.ends.append(len(self.data))
+
+    def copy(self) -> "_Vectors":
+        new = _Vectors()
+        new.data, new.ends = self.data[:], self.ends[:]
+        return new
+
+
+class _Codes(object):
+    """A column of few distinct strings (schools, grades) stored as indices into a table of them."""
+
+    def __init__(self) -> None:
+        self.values = []  # type: List[str]
+        self._codes = {}  # string -> its code
+        self.column = array("I")
+
+    def code(self, s: str) -> int:
+        c = self._codes.get(s)
+        if c is None:
+            c = self._codes[s] = len(self.values)
+            self.values.append(s)
+        return c
+
+    def __len__(self) -> int:
+        return len(self.column)
+
+    def __getitem__(self, i: int) -> str:
+        return self.values[self.column[i]]
+
+    def __setitem__(self, i: int, s: str) -> None:
+        self.column[i] = self.code(s)
+
+    def __delitem__(self, i: int) -> None:
+        del self.column[i]
+
+    def insert(self, i: int, s: str) -> None:
+        self.column.insert(i, self.code(s))
+
+    def append(self, s: str) -> None:
+        self.column.append(self.code(s))
+
+    def copy(self) -> "_Codes":
+        new = _Codes()
+        new.values, new._codes, new.column = list(self.values), dict(self._codes), self.column[:]
+        return new
+
+
+class _Bitsets(object):
+    """A column of sets of (question) indices, each row being `width` bytes of bits."""
+
+    def __init__(self) -> None:
+        self.width = 0
+        self.rows = 0
+        self.data = bytearray()
+
+    def _row(self, indices: Iterable[int]) -> bytearray:
+        indices = list(indices)
+        if indices and max(indices) // 8 + 1 > self.width:
+            self._widen(max(indices) // 8 + 1)
+
+        row = bytearray(self.width)
+        for i in indices:
+            row[i // 8] |= 1 << (i % 8)
+        return row
+
+    def _widen(self, width: int) -> None:
+        old, w = self.data, self.width
+        self.data = bytearray(self.rows * width)
+        for r in range(self.rows if w else 0):
+            self.data[r * width:r * width + w] = old[r * w:(r + 1) * w]
+        self.width = width
+
+    def __getitem__(self, r: int) -> List[int]:
+        w = self.width
+        return [b * 8 + k for b, byte in enumerate(self.data[r * w:(r + 1) * w]) if byte
+                for k in range(8) if byte >> k & 1]
+
+    def __setitem__(self, r: int, indices: Iterable[int]) -> None:
+        row = self._row(indices)
+        self.data[r * self.width:(r + 1) * self.width] = row
+
+    def __delitem__(self, r: int) -> None:
+        del self.data[r * self.width:(r + 1) * self.width]
+        self.rows -= 1
+
+    def insert(self, r: int, indices: Iterable[int]) -> None:
+        row = self._row(indices)
+        self.data[r * self.width:r * self.width] = row
+        self.rows += 1
+
+    def append(self, indices: Iterable[int]) -> None:
+        row = self._row(indices)  # before touching `data`, it might get widened
+        self.data += row
+        self.rows += 1
+
+    def copy(self) -> "_Bitsets":
+        new = _Bitsets()
+        new.width, new.rows, new.data = self.width, self.rows, bytearray(self.data)
+        return new
+
+
+class _Sharing(object):
+    """How many `ResultColumns` share the same columns, copies are made (and written) from different threads."""
+    __slots__ = ("count", "lock")
+
+    def __init__(self) -> None:
+        self.count = 1
+        self.lock = threading.Lock()
+
+
+class ResultColumns(MutableSequence):
+    """
+    The results of a test stored column by column: strings packed in a buffer each (or as codes into a table of
+    the distinct ones for schools, grades and fingerprints), degrees in arrays of doubles, `left`/`failed_at` as packed
+    bitsets and the responses (a bitmask a question) packed in an array. It's a sequence of `StudentDegree`s
+    (built when they're read) so it can stand for the plain list.
+
+    Looking a student up (by name and grade, or phone) indexes them the first time, the index is then kept up to
+    date as rows change. `version` counts the changes, for what's worked out of the results to know it's stale.
+
+    A copy shares the columns until either of them is changed, which copies them first.
+    """
+
+    def __init__(self, degrees: Iterable[StudentDegree] = ()) -> None:
+        self.names = _Strings()
+        self.phones = _Strings()
+        self.schools = _Codes()
+        self.grades = _Codes()
+        self.degrees = array("d")
+        self.out_ofs = array("d")
+        self.failed_at = _Bitsets()
+        self.left = _Bitsets()
+        self.responses = _Vectors()
+        self.fingerprints = _Codes()
+        self.version = 0
+        self._sharing = _Sharing()
+        self._students = None  # student key -> how many rows, once they're indexed
+        self._phones = None  # phone key -> how many rows
+
+        for degree in degrees:
+            self.append(degree)
+
+    def _columns(self) -> tuple:
+        return (self.names, self.phones, self.schools, self.grades, self.degrees, self.out_ofs, self.failed_at,
+                self.left, self.responses, self.fingerprints)
+
+    def copy(self) -> "ResultColumns":
+        new = ResultColumns()
+        with self._sharing.lock:
+            self._sharing.count += 1
+        (new.names, new.phones, new.schools, new.grades, new.degrees, new.out_ofs, new.failed_at, new.left,
+         new.responses, new.fingerprints) = self._columns()
+        new._sharing, new.version = self._sharing, self.version
+        return new
+
+    def _own(self) -> None:
+        """Copies the columns if they're shared, before they're changed."""
+        sharing = self._sharing
+        with sharing.lock:
+            if sharing.count == 1:
+                return
+            # column by column (each a single buffer copy) rather than row by row, under the lock so the others
+            # don't think they're alone in them before they're copied
+            (self.names, self.phones, self.schools, self.grades, self.degrees, self.out_ofs, self.failed_at,
+             self.left, self.responses, self.fingerprints) = (column[:] if isinstance(column, array) else column.copy()
+                                           for column in self._columns())
+            sharing.count -= 1
+        self._sharing = _Sharing()
+
+    def __len__(self) -> int:
+        return len(self.degrees)
+
+    def _index(self, i: int) -> int:
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("result index out of range")
+        return i
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = self._index(i)
+        return StudentDegree(self.names[i], self.phones[i], self.schools[i], self.grades[i], self.degrees[i],
+                             self.out_ofs[i], self.failed_at[i], self.left[i], self.responses[i],
+                             self.fingerprints[i])
+
+    def __setitem__(self, i, degree: StudentDegree) -> None:
+        if isinstance(i, slice):
+            raise TypeError("ResultColumns doesn't support slice assignment")
+        i = self._index(i)
+        self._own()
+        self._unindex(i)
+        for column, value in zip(self._columns(), self._fields(degree)):
+            column[i] = value
+        self._reindex(degree)
+        self.version += 1
+
+    def __delitem__(self, i) -> None:
+        if isinstance(i, slice):
+            for j in sorted(range(*i.indices(len(self))), reverse=True):
+                del self[j]
+            return
+        i = self._index(i)
+        self._own()
+        self._unindex(i)
+        for column in self._columns():
+            del column[i]
+        self.version += 1
+
+    def insert(self, i: int, degree: StudentDegree) -> None:
+        i = min(max(i + len(self) if i < 0 else i, 0), len(self))
+        self._own()
+        for column, value in zip(self._columns(), self._fields(degree)):
+            column.insert(i, value)
+        self._reindex(degree)
+        self.version += 1
+
+    def append(self, degree: StudentDegree) -> None:
+        self._own()
+        for column, value in zip(self._columns(), self._fields(degree)):
+            column.append(value)
+        self._reindex(degree)
+        self.version += 1
+
+    @staticmethod
+    def student_key(name: str, grade: str) -> tuple:
+        return (" ".join(unicodedata.normalize("NFKD", name).casefold().split()),
+                unicodedata.normalize("NFKD", grade))
+
+    @staticmethod
+    def phone_key(phone: str) -> str:
+        phone = "".join(phone.split())
+        return phone[2:] if phone.startswith("+2") else phone
+
+    @staticmethod
+    def _count(index: dict, key, n: int) -> None:
+        n += index.get(key, 0)
+        if n:
+            index[key] = n
+        else:
+            del index[key]
+
+    def _build_index(self) -> None:
+        self._students, self._phones = {}, {}
+        for i in range(len(self)):
+            self._count(self._students, self.student_key(self.names[i], self.grades[i]), 1)
+            self._count(self._phones, self.phone_key(self.phones[i]), 1)
+
+    def _reindex(self, degree: StudentDegree) -> None:
+        if self._students is not None:
+            self._count(self._students, self.student_key(degree.name, degree.grade), 1)
+            self._count(self._phones, self.phone_key(degree.phone), 1)
+
+    def _unindex(self, i: int) -> None:
+        if self._students is not None:
+            self._count(self._students, self.student_key(self.names[i], self.grades[i]), -1)
+            self._count(self._phones, self.phone_key(self.phones[i]), -1)
+
+    def has_student(self, name: str, grade: str) -> bool:
+        if self._students is None:
+            self._build_index()
+        return self.student_key(name, grade) in self._students
+
+    def has_phone(self, phone: str) -> bool:
+        if self._phones is None:
+            self._build_index()
+        return self.phone_key(phone) in self._phones
+
+    def __contains__(self, degree) -> bool:
+        if not isinstance(degree, StudentDegree) or not self.has_student(degree.name, degree.grade):
+            return False
+        return any(d == degree for d in self)  # the same student again, rare enough to just look
+
+    @staticmethod
+    def _fields(degree: StudentDegree) -> tuple:
+        return (degree.name, degree.phone, degree.school, degree.grade, float(degree.degree), float(degree.out_of),
+                degree.failed_at, degree.left, degree.responses, degree.fingerprint)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (ResultColumns, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __ne__(self, other) -> bool:
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return "ResultColumns({!r})".format(list(self))
+
+
+class ChangeLog(object):
+    """
+    Records the edits made to a working copy of some `ResultColumns` as they happen (rows are followed by a key
+    that survives deletions), so telling whether it differs from the saved copy is O(1) and saving only
+    touches the rows that changed.
+    """
+
+    def __init__(self, rows: int) -> None:
+        self.keys = list(range(rows))  # key of every row of the working copy
+        self.saved_keys = list(self.keys)  # and of every row of the saved one
+        self._next_key = rows
+        self.changed = {}  # key -> the saved row
+        self.inserted = set()
+        self.deleted = set()
+
+    def updated(self, row: int, old: StudentDegree, new: StudentDegree) -> None:
+        key = self.keys[row]
+        if key in self.inserted:
+            return
+        saved = self.changed.get(key, old)
+        if new == saved:
+            self.changed.pop(key, None)
+        else:
+            self.changed[key] = saved
+
+    def appended(self) -> None:
+        self.keys.append(self._next_key)
+        self.inserted.add(self._next_key)
+        self._next_key += 1
+
+    def arrived(self) -> None:
+        """A row appended to both copies (a result submitted while they're edited), nothing to save for it."""
+        self.keys.append(self._next_key)
+        self.saved_keys.append(self._next_key)
+        self._next_key += 1
+
+    def removed(self, row: int) -> None:
+        key = self.keys.pop(row)
+        if key in self.inserted:
+            self.inserted.remove(key)
+        else:
+            self.changed.pop(key, None)
+            self.deleted.add(key)
+
+    @property
+    def edited(self) -> bool:
+        return bool(self.changed or self.inserted or self.deleted)
+
+    def apply(self, working: ResultColumns, saved: ResultColumns) -> List[ResultChange]:
+        """
+        Brings `saved` up to `working` by replaying the changes on it, then starts over from there. Returns them
+        (updates, then deletions, then insertions), for storage that writes results row by row.
+        """
+        changes = []
+        if self.edited:
+            saved_rows = {key: i for i, key in enumerate(self.saved_keys)}
+            rows = {key: i for i, key in enumerate(self.keys) if key in self.changed or key in self.inserted}
+
+            for key in self.changed:
+                new = working[rows[key]]
+                changes.append(ResultChange(saved[saved_rows[key]], new))
+                saved[saved_rows[key]] = new
+            for i in sorted((saved_rows[key] for key in self.deleted), reverse=True):
+                changes.append(ResultChange(saved[i], None))
+                del saved[i]
+            for key in self.keys:
+                if key in self.inserted:
+                    new = working[rows[key]]
+                    changes.append(ResultChange(None, new))
+                    saved.append(new)
+
+            # rows that arrived in both copies can be before ones inserted in the working copy, so the saved
+            # one isn't necessarily in the same order
+            self.saved_keys = ([key for key in self.saved_keys if key not in self.deleted]
+                               + [key for key in self.keys if key in self.inserted])
+        self.changed.clear()
+        self.inserted.clear()
+        self.deleted.clear()
+        return changes
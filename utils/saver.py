@@ -0,0 +1,121 @@
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from PyQt4 import QtCore
+
+from .helpers import Test, StudentDegree
+from .results import ResultChange
+from .storage import Storage
+
+
+class SaveWorker(QtCore.QObject):
+    """
+    Writes to a `Storage` on a thread of its own so the gui never waits on encoding, encryption or the disk.
+
+    Saves of the whole bank queued back to back are merged into the last one (the ones before it are out of date
+    anyway, but the rows of results they changed add up), results queued back to back are written as one batch, in
+    the order they came. `saved` or `failed`
+    is emitted after each (merged) save of the bank and `results_added` or `results_failed` after each batch of results,
+    from the worker's thread, so they reach the gui queued.
+    """
+
+    def __init__(self, storage: Storage) -> None:
+        super().__init__()
+        self.storage = storage
+        # of ("save", tests, (changed, deltas, futures)) and ("results", results, futures)
+        self._queue = deque()  # type: deque
+        self._busy = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="save-worker", daemon=True)
+        self._thread.start()
+
+    def save(self, tests: List[Test], changed: Optional[Iterable[int]] = None,
+             deltas: Optional[Dict[int, List[ResultChange]]] = None) -> Future:
+        """See `Storage.save`, the future is done once the bank is written (by this save or one merged with it)."""
+        # the results are copied as they are now, they can be edited (or added to) while they're being written
+        tests = [test._replace(student_degrees=test.student_degrees.copy()) for test in tests]
+        changed = None if changed is None else set(changed)
+        deltas = dict(deltas or {})
+        future = Future()
+        futures = [future]
+
+        with self._cond:
+            if self._queue and self._queue[-1][0] == "save":
+                _, _, (pending, pending_deltas, futures) = self._queue.pop()
+                futures.append(future)
+                if changed is None or pending is None:
+                    changed, deltas = None, {}
+                else:
+                    # a test changed by either without its rows (written whole) is written whole
+                    merged = {}
+                    for test_id in changed | pending:
+                        first = pending_deltas.get(test_id) if test_id in pending else []
+                        second = deltas.get(test_id) if test_id in changed else []
+                        if first is not None and second is not None:
+                            merged[test_id] = first + second
+                    changed, deltas = changed | pending, merged
+            self._queue.append(("save", tests, (changed, deltas, futures)))
+            self._cond.notify_all()
+        return future
+
+    def add_result(self, test: Test, degree: StudentDegree) -> Future:
+        return self.add_results([(test.id, degree)])
+
+    def add_results(self, results: List[Tuple[int, StudentDegree]]) -> Future:
+        """Queues (test id, result) pairs, the future is done once they're written."""
+        future = Future()
+        with self._cond:
+            if self._queue and self._queue[-1][0] == "results":
+                self._queue[-1][1].extend(results)
+                self._queue[-1][2].append(future)
+            else:
+                self._queue.append(("results", list(results), [future]))
+            self._cond.notify_all()
+        return future
+
+    def flush(self, timeout: float = None) -> bool:
+        """Waits until everything queued is written, False if it's still writing after `timeout` seconds."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue and not self._busy, timeout)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue)
+                kind, item, arg = self._queue.popleft()
+                self._busy = True
+
+            try:
+                if kind == "save":
+                    changed, deltas, futures = arg
+                    self.storage.save(item, changed, deltas)
+                else:
+                    futures = arg
+                    self.storage.add_results(item)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                if kind == "results":
+                    self.results_failed.emit(str(e))
+                else:
+                    self.failed.emit(str(e))
+            else:
+                for future in futures:
+                    future.set_result(None)
+                if kind == "results":
+                    self.results_added.emit(item)
+                else:
+                    self.saved.emit()
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    # of saves of the bank
+    saved = QtCore.pyqtSignal(name="saved")
+    failed = QtCore.pyqtSignal(str, name="failed")
+    # with the (test id, result) pairs just written
+    results_added = QtCore.pyqtSignal(object, name="resultsAdded")
+    results_failed = QtCore.pyqtSignal(str, name="resultsFailed")
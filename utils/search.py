@@ -0,0 +1,110 @@
+import bisect
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Hashable, Iterable, List, Optional, Set, Tuple
+
+from .helpers import Question
+
+# letters written more than one way, searched for as one (hamzas and maddas are already split off by NFKD), and the
+# marks dropped: the diacritics (Arabic and Latin) and tatweel
+_FOLD = str.maketrans({
+    "ٱ": "ا",  # alef wasla -> alef
+    "ى": "ي",  # alef maqsura -> yaa
+    "ة": "ه",  # taa marbuta -> haa
+    "ـ": None,
+    **{chr(c): None for start, end in [(0x300, 0x36f), (0x610, 0x61a), (0x64b, 0x65f), (0x670, 0x670),
+                                       (0x6d6, 0x6ed)]
+       for c in range(start, end + 1) if unicodedata.category(chr(c)) == "Mn"},
+})
+_WORD = re.compile(r"\w+")
+
+
+def normalize(s: str) -> str:
+    """`s` as it's searched: NFKD like everything that's stored, without diacritics, and casefolded."""
+    return unicodedata.normalize("NFKD", s).translate(_FOLD).casefold()
+
+
+def words(s: str) -> List[str]:
+    return _WORD.findall(normalize(s))
+
+
+def question_text(question: Question) -> str:
+    return "\n".join([question.string] + [answer.string for answer in question.answers])
+
+
+class SearchIndex(object):
+    """
+    An inverted index of the words of some documents, each a `key` of a `group` (a test and one of its questions),
+    searched by the groups with a document having every word of a query (as a prefix of one of its words, so it
+    finds as it's typed).
+
+    A document is set again whenever it changes, only the words it gained or lost are touched. The words are kept
+    sorted as well, the ones starting with a prefix are a range of them.
+    """
+
+    def __init__(self) -> None:
+        self._postings = {}  # word -> the (group, key) of every document having it
+        self._docs = {}  # (group, key) -> the words of the document
+        self._groups = defaultdict(set)  # group -> the keys of its documents
+        self._words = []  # type: List[str]
+
+    def set(self, group: Hashable, key: Hashable, text: str) -> None:
+        doc = (group, key)
+        new = set(words(text))
+        old = self._docs.get(doc, set())
+
+        for word in old - new:
+            postings = self._postings[word]
+            postings.discard(doc)
+            if not postings:
+                del self._postings[word]
+                del self._words[bisect.bisect_left(self._words, word)]
+        for word in new - old:
+            if word not in self._postings:
+                self._postings[word] = set()
+                bisect.insort(self._words, word)
+            self._postings[word].add(doc)
+
+        if new:
+            self._docs[doc] = new
+            self._groups[group].add(key)
+        else:
+            self._docs.pop(doc, None)
+            self._groups[group].discard(key)
+
+    def remove(self, group: Hashable, key: Hashable) -> None:
+        self.set(group, key, "")
+
+    def drop(self, group: Hashable) -> None:
+        """Removes every document of `group`."""
+        for key in list(self._groups.get(group, ())):
+            self.remove(group, key)
+        self._groups.pop(group, None)
+
+    def set_all(self, group: Hashable, docs: Iterable[Tuple[Hashable, str]]) -> None:
+        """Replaces the documents of `group` with `docs`, (key, text) pairs."""
+        self.drop(group)
+        for key, text in docs:
+            self.set(group, key, text)
+
+    def _starting_with(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self._words, prefix)
+        return self._words[start:bisect.bisect_left(self._words, prefix + "\U0010ffff", start)]
+
+    def search(self, query: str) -> Optional[Set[Hashable]]:
+        """The groups matching `query`, None if it has no words (everything does)."""
+        query_words = set(words(query))
+        if not query_words:
+            return None
+
+        docs = None  # type: Optional[Set[Tuple[Hashable, Hashable]]]
+        # the longest words first, they're usually the ones with the fewest documents
+        for prefix in sorted(query_words, key=len, reverse=True):
+            matching = set()
+            for word in self._starting_with(prefix):
+                matching |= self._postings[word] if docs is None else self._postings[word] & docs
+            docs = matching
+            if not docs:
+                break
+        return {group for group, _ in docs}
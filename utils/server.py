@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Tuple
+
+from cryptography.fernet import InvalidToken
+
+from .helpers import Encryptor, Test, StudentDegree, TestSummary
+from .parsers import test_from_dict, test_to_dict
+from .storage import Storage
+
+log = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct("<I")
+# every message is one Fernet token keyed by this salt, fixed so neither side derives a key per connection
+_WIRE_SALT = b"examer-results-1"
+# nothing the clients send is anywhere near that big, a bigger length is a broken (or hostile) peer
+_MAX_MESSAGE = 64 * 1024 * 1024
+
+
+def _pack(message: dict) -> bytes:
+    data = Encryptor.fernet(_WIRE_SALT).encrypt(json.dumps(message).encode())
+    return _LENGTH.pack(len(data)) + data
+
+
+def _unpack(data: bytes) -> dict:
+    return json.loads(Encryptor.fernet(_WIRE_SALT).decrypt(data).decode())
+
+
+class ResultsServer(object):
+    """
+    Serves the tests to the stations of an exam lab and takes their results, so only the teacher's machine
+    touches the state folder.
+
+    Every message either way is a length (4 bytes, little endian) followed by an encrypted JSON object. A request
+    has an `op`: "summaries", "test" (with an `id`), "tests" or "submit" (with `results`, a list of
+    [test id, result] pairs, a station can send many at once); the answer has `ok` and what was asked for, or
+    `error`. A connection is kept for as many requests as the station makes.
+
+    Results are handed to `submit` (the `SaveWorker`'s `add_results`), answered once they're written, and the
+    number submitted per second is logged every `report_every` seconds. It runs an asyncio loop on a thread of
+    its own.
+    """
+
+    def __init__(self, storage: Storage, submit: Callable[[List[Tuple[int, StudentDegree]]], Future],
+                 host: str, port: int, report_every: float = 5.0) -> None:
+        self.storage = storage
+        self.submit = submit
+        self.host = host
+        self.port = port
+        self.report_every = report_every
+        self.submitted = 0
+        self._loop = None  # the server's event loop, and the server, once it's started
+        self._server = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """Starts listening, `port` is the one actually bound once it returns (for when it was 0)."""
+        self._thread = threading.Thread(target=self._run, name="results-server", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._server is None:
+            raise OSError("couldn't listen on {}:{}".format(self.host, self.port))
+
+    def stop(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._server = self._loop.run_until_complete(asyncio.start_server(self._serve, self.host, self.port))
+        except OSError:
+            log.exception("couldn't start the results server")
+            self._ready.set()
+            return
+
+        self.port = self._server.sockets[0].getsockname()[1]
+        log.info("serving results on %s:%d", self.host, self.port)
+        self._loop.create_task(self._report())
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            tasks = asyncio.all_tasks(self._loop)  # the report and a task per station still connected
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+    async def _report(self) -> None:
+        last, since = self.submitted, time.monotonic()
+        while True:
+            await asyncio.sleep(self.report_every)
+            now = time.monotonic()
+            if self.submitted != last:
+                log.info("%d results, %.1f/s", self.submitted, (self.submitted - last) / (now - since))
+            last, since = self.submitted, now
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = writer.get_extra_info("peername")
+        try:
+            while True:
+                try:
+                    head = await reader.readexactly(_LENGTH.size)
+                    length, = _LENGTH.unpack(head)
+                    if length > _MAX_MESSAGE:
+                        break
+                    request = _unpack(await reader.readexactly(length))
+                except asyncio.IncompleteReadError:
+                    break  # the station's gone
+                except (InvalidToken, ValueError):
+                    log.warning("dropping %s, sent something that isn't a request", peer)
+                    break
+
+                try:
+                    response = await self._handle(request)
+                except Exception as e:
+                    log.exception("request from %s failed", peer)
+                    response = {"ok": False, "error": str(e)}
+                writer.write(_pack(response))
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):  # gone, or the server's stopping
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, request: dict) -> dict:
+        op = request.get("op")
+        loop = asyncio.get_event_loop()
+
+        if op == "submit":
+            results = [(test_id, StudentDegree(**degree)) for test_id, degree in request["results"]]
+            await asyncio.wrap_future(self.submit(results))
+            self.submitted += len(results)
+            return {"ok": True}
+        if op == "summaries":
+            summaries = await loop.run_in_executor(None, self.storage.summaries)
+            return {"ok": True, "summaries": [summary._asdict() for summary in summaries]}
+        if op == "test":
+            test = await loop.run_in_executor(None, self.storage.load_test, request["id"])
+            return {"ok": True, "test": test_to_dict(test)}
+        if op == "tests":
+            tests = await loop.run_in_executor(None, self.storage.load)
+            return {"ok": True, "tests": [test_to_dict(test) for test in tests]}
+        return {"ok": False, "error": "unknown op {!r}".format(op)}
+
+
+class RemoteStorage(Storage):
+    """
+    The tests of a `ResultsServer`, read (and results submitted) over one connection that's kept open and made
+    again if it breaks. A read is retried once on a new connection, a submission never is: the server might
+    have it already.
+
+    The bank can't be saved from here, tests are edited on the machine that serves them.
+    """
+
+    def __init__(self, host: str, port: int, timeout: float = 30.0) -> None:
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._sock = None  # connected on the first request (and again after one fails)
+        self._lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        if self._sock is None:
+            self._sock = socket.create_connection((self.host, self.port), self.timeout)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return self._sock
+
+    def _close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _recv(self, n: int) -> bytes:
+        data = bytearray()
+        while len(data) < n:
+            chunk = self._sock.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("the server closed the connection")
+            data += chunk
+        return bytes(data)
+
+    def _request(self, request: dict, retry: bool = True) -> dict:
+        with self._lock:
+            for attempt in range(2 if retry else 1):
+                try:
+                    sock = self._connect()
+                    sock.sendall(_pack(request))
+                    length, = _LENGTH.unpack(self._recv(_LENGTH.size))
+                    response = _unpack(self._recv(length))
+                    break
+                except OSError:
+                    self._close()
+                    if attempt or not retry:
+                        raise
+                except BaseException:
+                    self._close()  # a reply that couldn't be read leaves the connection out of step
+                    raise
+
+        if not response["ok"]:
+            raise RuntimeError(response["error"])
+        return response
+
+    def summaries(self) -> List[TestSummary]:
+        return [TestSummary(**summary) for summary in self._request({"op": "summaries"})["summaries"]]
+
+    def load_test(self, test_id: int) -> Test:
+        return test_from_dict(self._request({"op": "test", "id": test_id})["test"])
+
+    def load(self) -> List[Test]:
+        return [test_from_dict(test) for test in self._request({"op": "tests"})["tests"]]
+
+    @property
+    def read_only(self) -> bool:
+        return True
+
+    def save(self, tests: List[Test], changed=None, deltas=None) -> None:
+        raise PermissionError("tests can only be saved on the machine serving them")
+
+    def add_results(self, results: List[Tuple[int, StudentDegree]]) -> None:
+        self._request({"op": "submit", "results": [[test_id, degree._asdict()] for test_id, degree in results]},
+                      retry=False)
+
+    @property
+    def empty(self) -> bool:
+        return not self.summaries()
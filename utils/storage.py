@@ -0,0 +1,697 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from cryptography.fernet import InvalidToken
+
+from .helpers import (
+    Encryptor,
+    Test, Question, Answer, StudentDegree, TestSummary,
+    LockFile,
+    atomic_open, res, summarize,
+)
+from .journal import ResultsJournal, SegmentedJournal, _replay
+from .results import ResultColumns, ResultChange
+from .parsers import (
+    parse_tests, dump_tests,
+    test_from_dict, test_to_dict,
+    snapshot_generation, snapshot_meta, verify_snapshot,
+    snapshot_offsets, read_snapshot_test,
+)
+from .vals import JOURNAL_COMPACT_SIZE, SERVER_HOST, SERVER_PORT, STATION
+
+log = logging.getLogger(__name__)
+
+
+class Storage(object):
+    """Where the tests and their results live."""
+
+    def load(self) -> List[Test]:
+        raise NotImplementedError
+
+    def load_test(self, test_id: int) -> Test:
+        for test in self.load():
+            if test.id == test_id:
+                return test
+        raise KeyError(test_id)
+
+    def summaries(self) -> List[TestSummary]:
+        """What's needed to list the tests without loading their questions and results."""
+        return [summarize(test) for test in self.load()]
+
+    def save(self, tests: List[Test], changed: Optional[Iterable[int]] = None,
+             deltas: Optional[Dict[int, List[ResultChange]]] = None) -> None:
+        """
+        Persists `tests` as the whole bank, `changed` (ids) tells which of them differ from what's stored,
+        `None` meaning all of them, backends that can write a single test only write those. `deltas` are the rows
+        of the results of some of the changed tests that were edited, backends writing results row by row only
+        write those (and leave the ones submitted meanwhile alone), the others' results are written whole.
+        """
+        raise NotImplementedError
+
+    @property
+    def read_only(self) -> bool:
+        """
+        Whether the tests can't be saved through it (results can still be added), the editor isn't offered and
+        `save` raises `PermissionError`.
+        """
+        return False
+
+    def add_result(self, test: Test, degree: StudentDegree) -> None:
+        self.add_results([(test.id, degree)])
+
+    def add_results(self, results: List[Tuple[int, StudentDegree]]) -> None:
+        """Records a batch of results, given as (test id, result) pairs."""
+        raise NotImplementedError
+
+    @property
+    def empty(self) -> bool:
+        raise NotImplementedError
+
+
+def _result_key(degree: StudentDegree) -> tuple:
+    return degree._replace(failed_at=tuple(degree.failed_at), left=tuple(degree.left),
+                           responses=tuple(degree.responses))
+
+
+class FileStorage(Storage):
+    """
+    The whole bank in one encrypted JSON file plus the results submitted since, journaled by every station that
+    shares the folder in segments of its own, and an index of the tests' summaries beside them. The file holds
+    the watermarks of the segments up to where it has their results, and writing it (a save, or a station
+    folding the journal back in) is done by one station at a time under a lock file.
+
+    Every save writes a new generation of the file beside it and swaps it in, the one before it is kept as a
+    backup. If the file doesn't pass its checksum the backup is loaded instead, with the journal replayed on it
+    from its own watermarks.
+    """
+
+    def __init__(self, path: str, journal: SegmentedJournal, index_path: str) -> None:
+        self.path = path
+        self.backup_path = path + ".bak"
+        self.journal = journal
+        self.index_path = index_path
+        self.lock = LockFile(path + ".lock")
+        self.seen = {}  # type: Dict[int, ResultColumns]  # test id -> its results as they were loaded (or saved) here
+        self._latest = None, {}  # the stamp of the snapshot and its watermarks
+
+    @property
+    def generation(self) -> int:
+        return max([snapshot_generation(path) for path in (self.path, self.backup_path) if os.path.isfile(path)],
+                   default=0)
+
+    def _valid_snapshots(self) -> Iterator[str]:
+        for path in (self.path, self.backup_path):
+            if os.path.isfile(path) and verify_snapshot(path):
+                yield path
+
+    def _load(self) -> Tuple[List[Test], Dict[str, int]]:
+        for path in self._valid_snapshots():
+            try:
+                tests = parse_tests(path, encrypted=True)
+                watermarks = snapshot_meta(path).get("watermarks", {})
+            except (InvalidToken, ValueError, KeyError, TypeError):
+                continue
+            return tests, self.journal.replay(tests, watermarks)
+
+        if self.empty:
+            return [], self.journal.replay([], {})
+        raise InvalidToken("Neither {} nor its backup could be read".format(self.path))
+
+    def load(self) -> List[Test]:
+        tests, _ = self._load()
+        self.seen = {test.id: test.student_degrees.copy() for test in tests}
+        return tests
+
+    def _read_index(self) -> Optional[dict]:
+        """The index, if it's of the file as it is now."""
+        try:
+            with open(self.index_path, "rb") as f:
+                index = json.loads(Encryptor.decrypt(f.read()))
+            if index["snapshot"] == self._snapshot_stamp():
+                return index
+        except (OSError, ValueError, KeyError, TypeError, InvalidToken):
+            pass
+        return None
+
+    def summaries(self) -> List[TestSummary]:
+        if self.empty:
+            return []
+
+        index = self._read_index()
+        if index is not None:
+            return [TestSummary(**s) for s in index["tests"]]
+
+        # no index yet (or it's from another snapshot), build it
+        tests, _ = self._load()
+        self._write_index(tests)
+        return [summarize(test) for test in tests]
+
+    def load_test(self, test_id: int) -> Test:
+        """
+        Only decrypts the test's own record of the file, where the index says it starts, and replays the journal
+        on it. It's read out of the whole bank if the index can't tell (or the file changed while it was read).
+        Either way `seen` is left alone, it's about what `load` gave.
+        """
+        index = self._read_index()
+        if index is not None and len(index.get("offsets", ())) == len(index["tests"]):
+            stamp = index["snapshot"]
+            try:
+                i = [s["id"] for s in index["tests"]].index(test_id)
+                test = read_snapshot_test(self.path, index["offsets"][i])
+                watermarks = snapshot_meta(self.path).get("watermarks", {})
+            except (OSError, ValueError, KeyError, TypeError, InvalidToken):
+                test = None
+            if test is not None and test.id == test_id and self._snapshot_stamp() == stamp:
+                self.journal.replay([test], watermarks)
+                return test
+
+        for test in self._load()[0]:
+            if test.id == test_id:
+                return test
+        raise KeyError(test_id)
+
+    def save(self, tests: List[Test], changed: Optional[Iterable[int]] = None,
+             deltas: Optional[Dict[int, List[ResultChange]]] = None) -> None:
+        """
+        `tests` hold the results that were loaded (maybe edited), those submitted since (by this station or any
+        other) are added to them from what's stored now: the stored ones that weren't there when they were
+        loaded, whatever order folding the journal put them in, unless they were added to `tests` already
+        (say, as they arrived).
+        """
+        with self.lock:
+            stored, watermarks = self._load()
+            stored = {test.id: test.student_degrees for test in stored}
+            seen = {}
+            for test in tests:
+                seen[test.id] = test.student_degrees.copy()
+                if test.id in stored and test.id in self.seen:
+                    loaded = Counter(map(_result_key, self.seen[test.id]))
+                    new = Counter(map(_result_key, stored[test.id])) - loaded
+                    new -= Counter(map(_result_key, test.student_degrees)) - loaded
+                    for degree in stored[test.id]:
+                        if new[_result_key(degree)] > 0:
+                            new[_result_key(degree)] -= 1
+                            test.student_degrees.append(degree)
+            self._write(tests, watermarks)
+            self.seen = seen
+
+    def _write(self, tests: List[Test], watermarks: Dict[str, int]) -> None:
+        # with the lock held
+        generation = self.generation + 1
+        new_path = self.path + ".new"
+        dump_tests(tests, new_path, encrypt=True, generation=generation, meta={"watermarks": watermarks})
+
+        # whatever point this stops at, there's a whole snapshot, and the journal from its watermarks on
+        if os.path.isfile(self.path) and verify_snapshot(self.path):
+            os.replace(self.path, self.backup_path)
+        os.replace(new_path, self.path)
+
+        kept = [watermarks]
+        if os.path.isfile(self.backup_path):
+            kept.append(snapshot_meta(self.backup_path).get("watermarks", {}))
+        self.journal.roll(kept)
+
+        self._write_index(tests)
+
+    def compact(self) -> None:
+        """Folds the journal into the file, unless another station is at it already."""
+        if not self.lock.acquire(timeout=0):
+            return
+        try:
+            self._write(*self._load())
+        finally:
+            self.lock.release()
+
+    def _snapshot_stamp(self) -> list:
+        stamp = []
+        for path in (self.path, self.backup_path):
+            try:
+                stat = os.stat(path)
+            except OSError:  # missing, or being swapped by another station
+                stamp.append(None)
+            else:
+                stamp.append([stat.st_size, stat.st_mtime_ns])
+        return stamp
+
+    def _write_index(self, tests: List[Test]) -> None:
+        index = {"snapshot": self._snapshot_stamp(), "tests": [summarize(test)._asdict() for test in tests]}
+        try:
+            # where each test is in the file, for `load_test`, unless they were read out of the backup
+            offsets = snapshot_offsets(self.path)
+        except OSError:
+            offsets = []
+        if len(offsets) == len(tests):
+            index["offsets"] = offsets
+        with atomic_open(self.index_path) as f:
+            f.write(Encryptor.encrypt(json.dumps(index)))
+
+    def _latest_watermarks(self) -> Dict[str, int]:
+        """The watermarks of the file, read again only when it has changed."""
+        stamp = self._snapshot_stamp()
+        if self._latest[0] != stamp:
+            try:
+                self._latest = stamp, snapshot_meta(self.path).get("watermarks", {})
+            except (OSError, ValueError, InvalidToken):
+                self._latest = stamp, {}
+        return self._latest[1]
+
+    def add_results(self, results: List[Tuple[int, StudentDegree]]) -> None:
+        self.journal.extend(results)
+        if self.journal.needs_compaction(self._latest_watermarks()):
+            self.compact()
+
+    @property
+    def empty(self) -> bool:
+        return not any(os.path.isfile(path) and os.path.getsize(path) for path in (self.path, self.backup_path))
+
+
+class ShardedStorage(Storage):
+    """
+    One encrypted file per test (named after its id) plus a manifest holding each shard's digest and the tests'
+    summaries, so saving only writes the shards that changed and a corrupt shard only loses its own test: it's
+    skipped when loading (its id is kept in `unreadable`) and left as it is on disk.
+
+    Results go to a journal first, like `FileStorage`. The manifest marks how far into the journal the shards
+    hold its results (its length, and digest, then), so a crash between writing the manifest and emptying the
+    journal doesn't add them again. The results of the tests that couldn't be read stay journaled.
+    """
+
+    def __init__(self, directory: str, journal: ResultsJournal, workers: int = 4) -> None:
+        self.directory = directory
+        self.journal = journal
+        self.workers = workers
+        self.unreadable = set()  # ids of the tests whose shards couldn't be read
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, "manifest.enc")
+
+    def shard_path(self, test_id: int) -> str:
+        return os.path.join(self.directory, "test-{}.enc".format(test_id))
+
+    def _read_manifest(self) -> Tuple[List[dict], dict]:
+        """The entries of the manifest and its mark of the journal."""
+        if not os.path.isfile(self.manifest_path):
+            return [], {}
+        with open(self.manifest_path, "rb") as f:
+            manifest = json.loads(Encryptor.decrypt(f.read()))
+        if isinstance(manifest, list):  # from before the journal was marked
+            return manifest, {}
+        return manifest["tests"], manifest["journal"]
+
+    def _manifest(self) -> List[dict]:
+        return self._read_manifest()[0]
+
+    def _read_shard(self, test_id: int) -> Test:
+        with open(self.shard_path(test_id), "rb") as f:
+            return test_from_dict(json.loads(Encryptor.decrypt(f.read())))
+
+    def _try_read_shard(self, test_id: int) -> Optional[Test]:
+        try:
+            test = self._read_shard(test_id)
+        except (OSError, ValueError, KeyError, TypeError, InvalidToken) as e:
+            log.warning("Skipping test %s, its shard couldn't be read: %r", test_id, e)
+            self.unreadable.add(test_id)
+            return None
+        self.unreadable.discard(test_id)
+        return test
+
+    def _journaled(self, mark: dict) -> Tuple[List[Tuple[int, StudentDegree]], dict]:
+        """
+        The journaled results that aren't in the shards yet, going by `mark`, and the mark of the journal as it is
+        (for once they are).
+        """
+        records, end = self.journal.read()
+        try:
+            with open(self.journal.path, "rb") as f:
+                data = f.read(end)
+        except OSError:
+            data = b""
+
+        new_mark = {"offset": end, "records": len(records), "digest": hashlib.sha256(data).hexdigest()}
+        offset = mark.get("offset", 0)
+        if mark and len(data) >= offset and hashlib.sha256(data[:offset]).hexdigest() == mark["digest"]:
+            # the journal wasn't emptied after the manifest was written, what it held then is in the shards
+            unapplied = set(mark.get("unapplied", ()))
+            records = ([record for record in records[:mark["records"]] if record[0] in unapplied]
+                       + records[mark["records"]:])
+        return records, new_mark
+
+    def load(self) -> List[Test]:
+        entries, mark = self._read_manifest()
+        with ThreadPoolExecutor(self.workers) as pool:
+            tests = [test for test in pool.map(self._try_read_shard, [entry["id"] for entry in entries])
+                     if test is not None]
+        _replay(tests, self._journaled(mark)[0])
+        return tests
+
+    def load_test(self, test_id: int) -> Test:
+        test = self._read_shard(test_id)
+        _replay([test], self._journaled(self._read_manifest()[1])[0])
+        return test
+
+    def summaries(self) -> List[TestSummary]:
+        return [TestSummary(**entry["summary"]) for entry in self._manifest()]
+
+    def save(self, tests: List[Test], changed: Optional[Iterable[int]] = None,
+             deltas: Optional[Dict[int, List[ResultChange]]] = None) -> None:
+        """
+        The journaled results missing from `tests` (submitted after they were loaded) are added to them before
+        their shards are written, as the journal is emptied of them then. Those `deltas` changed or removed aren't.
+        """
+        entries, mark = self._read_manifest()
+        digests = {entry["id"]: entry["digest"] for entry in entries}
+        records, mark = self._journaled(mark)
+        if changed is not None:
+            # the shards of the tests with journaled results are about to miss them once the journal is emptied
+            changed = set(changed) | {test_id for test_id, _ in records}
+
+        journaled = {}
+        for test_id, degree in records:
+            journaled.setdefault(test_id, []).append(degree)
+        deltas = deltas or {}
+
+        manifest = []
+        for test in tests:
+            if test.id in journaled:
+                missing = Counter(map(_result_key, journaled[test.id]))
+                missing -= Counter(map(_result_key, test.student_degrees))
+                missing -= Counter(_result_key(change.old) for change in deltas.get(test.id, ())
+                                   if change.old is not None)
+                for degree in journaled[test.id]:
+                    if missing[_result_key(degree)] > 0:
+                        missing[_result_key(degree)] -= 1
+                        test.student_degrees.append(degree)
+            digest = digests.get(test.id)
+            if changed is None or test.id in changed or digest is None:
+                digest = self._write_shard(test, digest)
+            manifest.append({"id": test.id, "digest": digest, "summary": summarize(test)._asdict()})
+
+        # the tests that couldn't be loaded aren't among `tests`, they're kept (results and all) until they're fixed
+        ids = {test.id for test in tests}
+        kept = [entry for entry in entries if entry["id"] in self.unreadable and entry["id"] not in ids]
+        manifest.extend(kept)
+        self._finish(manifest, records, mark, {entry["id"] for entry in kept})
+
+        for test_id in set(digests) - ids - {entry["id"] for entry in kept}:
+            os.remove(self.shard_path(test_id))
+
+    def _write_shard(self, test: Test, old_digest: str = None) -> str:
+        data = json.dumps(test_to_dict(test))
+        digest = hashlib.sha256(data.encode()).hexdigest()
+        if digest != old_digest:
+            with atomic_open(self.shard_path(test.id)) as f:
+                f.write(Encryptor.encrypt(data))
+        return digest
+
+    def _write_manifest(self, manifest: List[dict], mark: dict) -> None:
+        with atomic_open(self.manifest_path) as f:
+            f.write(Encryptor.encrypt(json.dumps({"tests": manifest, "journal": mark})))
+
+    def _finish(self, manifest: List[dict], records: List[Tuple[int, StudentDegree]], mark: dict,
+                unapplied: set) -> None:
+        """
+        Writes the manifest once the shards hold the journaled `records` (marked by `mark`), but those of the
+        `unapplied` tests, then empties the journal of all the others.
+        """
+        self._write_manifest(manifest, dict(mark, unapplied=sorted(unapplied)))
+        self.journal.rewrite([record for record in records if record[0] in unapplied])
+
+    def add_results(self, results: List[Tuple[int, StudentDegree]]) -> None:
+        self.journal.extend(results)
+        if self.journal.needs_compaction:
+            self.compact()
+
+    def compact(self) -> None:
+        """Folds the journal into the shards of the tests it has results for (those that can be read)."""
+        manifest, mark = self._read_manifest()
+        records, mark = self._journaled(mark)
+        ids = {test_id for test_id, _ in records}
+        tests = [test for test in (self._try_read_shard(entry["id"]) for entry in manifest if entry["id"] in ids)
+                 if test is not None]
+        _replay(tests, records)
+
+        digests = {test.id: self._write_shard(test) for test in tests}
+        for entry in manifest:
+            entry["digest"] = digests.get(entry["id"], entry["digest"])
+
+        self._finish(manifest, records, mark, {entry["id"] for entry in manifest if entry["id"] in ids} - set(digests))
+
+    @property
+    def empty(self) -> bool:
+        return not self._manifest()
+
+
+def _norm(s: str) -> str:
+    return unicodedata.normalize("NFKD", s)
+
+
+def _seal(s: str) -> bytes:
+    return Encryptor.encrypt(s)
+
+
+def _unseal(b: bytes) -> str:
+    return Encryptor.decrypt(b)
+
+
+def _key(*parts: str) -> bytes:
+    """Keyed digest of (encrypted) fields we need to look rows up by."""
+    return hmac.new(Encryptor.p, "\0".join(_norm(p).casefold() for p in parts).encode(), hashlib.sha256).digest()
+
+
+class SQLiteStorage(Storage):
+    """
+    One row per test, question, answer and result, so saving a test or recording a result only touches its rows.
+    Text fields are encrypted one by one, those we search by have a keyed digest beside them.
+    """
+
+    _schema = """
+        CREATE TABLE IF NOT EXISTS tests (
+            id INTEGER PRIMARY KEY,
+            name BLOB NOT NULL,
+            description BLOB NOT NULL,
+            time INTEGER NOT NULL,
+            degree REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS questions (
+            test_id INTEGER NOT NULL REFERENCES tests(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            string BLOB NOT NULL,
+            pic TEXT,
+            PRIMARY KEY (test_id, position)
+        );
+        CREATE TABLE IF NOT EXISTS answers (
+            test_id INTEGER NOT NULL,
+            question INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            string BLOB NOT NULL,
+            valid INTEGER NOT NULL,
+            PRIMARY KEY (test_id, question, position),
+            FOREIGN KEY (test_id, question) REFERENCES questions(test_id, position) ON DELETE CASCADE
+        );
+        CREATE TABLE IF NOT EXISTS student_degrees (
+            id INTEGER PRIMARY KEY,
+            test_id INTEGER NOT NULL REFERENCES tests(id) ON DELETE CASCADE,
+            name BLOB NOT NULL,
+            name_key BLOB NOT NULL,
+            phone BLOB NOT NULL,
+            phone_key BLOB NOT NULL,
+            school BLOB NOT NULL,
+            grade TEXT NOT NULL,
+            degree REAL NOT NULL,
+            out_of REAL NOT NULL,
+            failed_at TEXT NOT NULL,
+            "left" TEXT NOT NULL,
+            responses TEXT NOT NULL DEFAULT '[]',
+            fingerprint TEXT NOT NULL DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS student_degrees_test ON student_degrees (test_id);
+        CREATE INDEX IF NOT EXISTS student_degrees_student ON student_degrees (test_id, name_key, grade);
+        CREATE INDEX IF NOT EXISTS student_degrees_phone ON student_degrees (phone_key);
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # used from the save worker's thread as well as the gui's, one at a time
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(self._schema)
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(student_degrees)")]
+        if "responses" not in columns:  # made before the responses were kept
+            self.db.execute("ALTER TABLE student_degrees ADD COLUMN responses TEXT NOT NULL DEFAULT '[]'")
+        if "fingerprint" not in columns:  # or their fingerprints
+            self.db.execute("ALTER TABLE student_degrees ADD COLUMN fingerprint TEXT NOT NULL DEFAULT ''")
+
+    def load(self) -> List[Test]:
+        with self.lock:
+            ids = [row[0] for row in self.db.execute("SELECT id FROM tests ORDER BY id")]
+            return [self.load_test(test_id) for test_id in ids]
+
+    def summaries(self) -> List[TestSummary]:
+        with self.lock:
+            return [TestSummary(test_id, _unseal(name), _unseal(description), time, degree, questions)
+                    for test_id, name, description, time, degree, questions in self.db.execute(
+                        "SELECT id, name, description, time, degree,"
+                        " (SELECT count(*) FROM questions WHERE test_id = tests.id) FROM tests ORDER BY id")]
+
+    def load_test(self, test_id: int) -> Test:
+        with self.lock:
+            name, description, time, degree = self.db.execute(
+                "SELECT name, description, time, degree FROM tests WHERE id = ?", (test_id,)).fetchone()
+
+            answers = {}
+            for question, string, valid in self.db.execute(
+                    "SELECT question, string, valid FROM answers WHERE test_id = ? ORDER BY question, position",
+                    (test_id,)):
+                answers.setdefault(question, []).append(Answer(_unseal(string), bool(valid)))
+
+            questions = tuple(Question(_unseal(string), pic, tuple(answers.get(position, ())))
+                              for position, string, pic in self.db.execute(
+                                "SELECT position, string, pic FROM questions WHERE test_id = ? ORDER BY position",
+                                (test_id,)))
+
+            return Test(test_id, _unseal(name), _unseal(description), time, questions, degree,
+                        self.load_results(test_id))
+
+    def load_results(self, test_id: int) -> ResultColumns:
+        with self.lock:
+            return ResultColumns(map(self._result_from_row, self.db.execute(
+                'SELECT name, phone, school, grade, degree, out_of, failed_at, "left", responses, fingerprint'
+                " FROM student_degrees WHERE test_id = ? ORDER BY id", (test_id,))))
+
+    def save(self, tests: List[Test], changed: Optional[Iterable[int]] = None,
+             deltas: Optional[Dict[int, List[ResultChange]]] = None) -> None:
+        changed = None if changed is None else set(changed)
+        deltas = deltas or {}
+        with self.lock, self.db:
+            ids = [test.id for test in tests]
+            self.db.execute("DELETE FROM tests WHERE id NOT IN ({})".format(", ".join("?" * len(ids))), ids)
+            for test in tests:
+                if changed is None or test.id in changed:
+                    self._write_test(test, deltas.get(test.id))
+
+    def _upsert(self, table: str, key: Dict[str, object], values: Dict[str, object]) -> bool:
+        """Updates the row of `table` at `key` or inserts it, True if it was there."""
+        if self.db.execute("UPDATE {} SET {} WHERE {}".format(table, ", ".join('"{}" = ?'.format(c) for c in values),
+                                                              " AND ".join("{} = ?".format(c) for c in key)),
+                           list(values.values()) + list(key.values())).rowcount:
+            return True
+        columns = list(key) + list(values)
+        self.db.execute("INSERT INTO {} ({}) VALUES ({})".format(table, ", ".join('"{}"'.format(c) for c in columns),
+                                                                  ", ".join("?" * len(columns))),
+                        list(key.values()) + list(values.values()))
+        return False
+
+    def _write_test(self, test: Test, changes: Optional[List[ResultChange]] = None) -> None:
+        """
+        Writes the rows of `test` over the ones stored. Its results are written whole if it's new or `changes` is
+        None, otherwise only the rows in `changes` are, so results recorded since it was loaded stay.
+        """
+        existed = self._upsert("tests", {"id": test.id}, {"name": _seal(test.name),
+                                                          "description": _seal(test.description),
+                                                          "time": test.time, "degree": test.degree})
+        for i, question in enumerate(test.questions):
+            self._upsert("questions", {"test_id": test.id, "position": i},
+                         {"string": _seal(question.string), "pic": question.pic})
+            for j, answer in enumerate(question.answers):
+                self._upsert("answers", {"test_id": test.id, "question": i, "position": j},
+                             {"string": _seal(answer.string), "valid": answer.valid})
+            self.db.execute("DELETE FROM answers WHERE test_id = ? AND question = ? AND position >= ?",
+                            (test.id, i, len(question.answers)))
+        # cascades to their answers
+        self.db.execute("DELETE FROM questions WHERE test_id = ? AND position >= ?", (test.id, len(test.questions)))
+
+        if not existed or changes is None:
+            self.db.execute("DELETE FROM student_degrees WHERE test_id = ?", (test.id,))
+            self.db.executemany(self._insert_result, [self._result_row(test.id, d) for d in test.student_degrees])
+            return
+
+        for old, new in changes:
+            row_id = None if old is None else self._find_result(test.id, old)
+            if new is None:
+                if row_id is not None:
+                    self.db.execute("DELETE FROM student_degrees WHERE id = ?", (row_id,))
+            elif row_id is None:  # inserted, or updated after it was deleted from under the editor
+                self.db.execute(self._insert_result, self._result_row(test.id, new))
+            else:
+                self.db.execute(self._update_result, self._result_row(test.id, new)[1:] + (row_id,))
+
+    def _find_result(self, test_id: int, degree: StudentDegree) -> Optional[int]:
+        """The id of the first row of the results of the test that's `degree`, if there's one."""
+        key = _result_key(degree)
+        for row in self.db.execute(
+                'SELECT id, name, phone, school, grade, degree, out_of, failed_at, "left", responses, fingerprint'
+                " FROM student_degrees WHERE test_id = ? AND name_key = ? AND grade = ? ORDER BY id",
+                (test_id, _key(degree.name), degree.grade)):
+            if _result_key(self._result_from_row(row[1:])) == key:
+                return row[0]
+        return None
+
+    _insert_result = ("INSERT INTO student_degrees (test_id, name, name_key, phone, phone_key, school, grade,"
+                      ' degree, out_of, failed_at, "left", responses, fingerprint)'
+                      " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+    _update_result = ("UPDATE student_degrees SET name = ?, name_key = ?, phone = ?, phone_key = ?, school = ?,"
+                      ' grade = ?, degree = ?, out_of = ?, failed_at = ?, "left" = ?, responses = ?, fingerprint = ?'
+                      " WHERE id = ?")
+
+    @staticmethod
+    def _result_from_row(row: tuple) -> StudentDegree:
+        name, phone, school, grade, degree, out_of, failed_at, left, responses, fingerprint = row
+        return StudentDegree(_unseal(name), _unseal(phone), _unseal(school), grade, degree, out_of,
+                             json.loads(failed_at), json.loads(left), json.loads(responses), fingerprint)
+
+    @staticmethod
+    def _result_row(test_id: int, d: StudentDegree) -> tuple:
+        return (test_id, _seal(d.name), _key(d.name), _seal(d.phone), _key(d.phone), _seal(d.school),
+                d.grade, d.degree, d.out_of, json.dumps(list(d.failed_at)), json.dumps(list(d.left)),
+                json.dumps(list(d.responses)), d.fingerprint)
+
+    def add_results(self, results: List[Tuple[int, StudentDegree]]) -> None:
+        with self.lock, self.db:
+            self.db.executemany(self._insert_result, [self._result_row(test_id, d) for test_id, d in results])
+
+    @property
+    def empty(self) -> bool:
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM tests LIMIT 1").fetchone() is None
+
+
+def migrate(source: Storage, target: Storage) -> None:
+    target.save(source.load())
+
+
+def open_storage(kind: str) -> Storage:
+    assert kind in ("file", "sqlite", "sharded", "remote")
+
+    if kind == "remote":
+        from .server import RemoteStorage  # it's a `Storage` itself
+        return RemoteStorage(SERVER_HOST, SERVER_PORT)
+
+    file_storage = FileStorage(res("data.enc", "state"),
+                               SegmentedJournal(res("", "state"), STATION or socket.gethostname(),
+                                                JOURNAL_COMPACT_SIZE),
+                               res("index.enc", "state"))
+    if kind == "file":
+        return file_storage
+
+    if kind == "sqlite":
+        storage = SQLiteStorage(res("data.db", "state"))  # type: Storage
+    else:
+        shards = res("shards", "state")
+        storage = ShardedStorage(shards, ResultsJournal(os.path.join(shards, "results.jnl"), JOURNAL_COMPACT_SIZE))
+
+    if storage.empty and not file_storage.empty:  # first run on the database, bring the old data over
+        migrate(file_storage, storage)
+    return storage
@@ -21,3 +21,29 @@ GRADES = [
         "الثاني الثانوي",
         "الثالث الثانوي",
     ]
+
+# once the results journal grows past this (in bytes) it's folded back into data.enc
+JOURNAL_COMPACT_SIZE = 64 * 1024
+
+# "file" (res/state/data.enc), "sqlite" (res/state/data.db) or "sharded" (res/state/shards/, a file per test),
+# the last two are migrated from data.enc on first use, or "remote" for the tests of the machine running
+# `main.py --serve` at SERVER_HOST
+STORAGE_BACKEND = "file"
+
+# where the results server listens (on the teacher's machine), and where the stations find it
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8642
+
+# decoded question images kept in memory (in bytes), and the size they're scaled down to fit in
+IMAGE_CACHE_SIZE = 64 * 1024 * 1024
+IMAGE_MAX_SIZE = (800, 600)
+# and the size of the thumbnails the tester shows, made once for every image imported
+IMAGE_THUMB_SIZE = (320, 320)
+
+# tests whose tabs the editor keeps built, past that the least recently opened are released (what's being edited in
+# them is kept) and built again when they're opened
+OPEN_EDITORS = 8
+
+# the name this copy of the app journals results under, when more than one share the state folder,
+# None for the name of the machine
+STATION = None
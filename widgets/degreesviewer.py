@@ -1,28 +1,142 @@
 import functools
+import math
 from typing import List
 
 from PyQt4 import QtCore, QtGui
 
+from utils.grading import AnswerKey, Grades, regrade
 from utils.helpers import Test, res, StudentDegree, ReasonFlag
+from utils.results import ResultColumns, ChangeLog, ResultChange
 from utils.vals import headers
 from widgets.innerwidgets import NameItemDelegate, PhoneItemDelegate, GradeItemDelegate, SchoolItemDelegate
 
 
-class DegreesTable(QtGui.QTableWidget):
+class DegreesModel(QtCore.QAbstractTableModel):
+    """Shows a test's `ResultColumns` as they are, cells are only built when the view asks for them."""
+
+    SortRole = QtCore.Qt.UserRole
+    editable = ("name", "school", "grade", "phone")
+
+    def __init__(self, results: ResultColumns, changes: ChangeLog, columns: List[str],
+                 parent: QtCore.QObject = None) -> None:
+        super().__init__(parent)
+        self.results = results
+        self.changes = changes
+        self.columns = columns
+        self._getters = {
+            "name": lambda r: results.names[r],
+            "phone": lambda r: results.phones[r],
+            "school": lambda r: results.schools[r],
+            "grade": lambda r: results.grades[r],
+            "degree": lambda r: results.degrees[r],
+            "out_of": lambda r: results.out_ofs[r],
+            "failed_at": lambda r: results.failed_at[r],
+            "left": lambda r: results.left[r],
+        }
+
+    def rowCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.results)
+
+    def columnCount(self, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index: QtCore.QModelIndex, role: int = QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        value = self._getters[self.columns[index.column()]](index.row())
+        if role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+            if isinstance(value, list):
+                return ', '.join(map(lambda x: str(int(x) + 1), value)) if value else 'N/A'
+            return str(value)
+        elif role == DegreesModel.SortRole:
+            return len(value) if isinstance(value, list) else value
+        elif role == QtCore.Qt.TextAlignmentRole:
+            return QtCore.Qt.AlignCenter
+        return None
+
+    def setData(self, index: QtCore.QModelIndex, value, role: int = QtCore.Qt.EditRole) -> bool:
+        column = self.columns[index.column()]
+        if role != QtCore.Qt.EditRole or column not in DegreesModel.editable:
+            return False
+
+        row = index.row()
+        old = self.results[row]
+        self.results[row] = new = old._replace(**{column: value})
+        self.changes.updated(row, old, new)
+        self.dataChanged.emit(index, index)
+        return True
+
+    def regrade(self, rows, grades: Grades, out_of: float) -> int:
+        """Sets the new grades of `rows` (what `grading.regrade` gives) in one go, returns how many changed."""
+        changed = 0
+        for k, row in enumerate(rows.tolist()):
+            old = self.results[row]
+            degree = float(grades.totals[k])
+            if math.isclose(degree, old.degree):  # summed in another order before, don't count it as an edit
+                degree = old.degree
+            new = old._replace(degree=degree, out_of=out_of, failed_at=grades.failed_at(k), left=grades.left_at(k))
+            if new != old:
+                self.results[row] = new
+                self.changes.updated(row, old, new)
+                changed += 1
+
+        if changed:
+            self.dataChanged.emit(self.index(0, 0), self.index(self.rowCount() - 1, self.columnCount() - 1))
+        return changed
+
+    def flags(self, index: QtCore.QModelIndex) -> int:
+        flags = QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled
+        if self.columns[index.column()] in DegreesModel.editable:
+            flags |= QtCore.Qt.ItemIsEditable
+        return flags
+
+    def headerData(self, section: int, orientation: int, role: int = QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        return self.columns[section] if orientation == QtCore.Qt.Horizontal else str(section + 1)
+
+    def append(self, degree: StudentDegree, saved=False) -> None:
+        row = len(self.results)
+        self.beginInsertRows(QtCore.QModelIndex(), row, row)
+        self.results.append(degree)
+        if saved:
+            self.changes.arrived()
+        else:
+            self.changes.appended()
+        self.endInsertRows()
+
+    def removeRows(self, row: int, count: int, parent: QtCore.QModelIndex = QtCore.QModelIndex()) -> bool:
+        self.beginRemoveRows(parent, row, row + count - 1)
+        del self.results[row:row + count]
+        for _ in range(count):
+            self.changes.removed(row)
+        self.endRemoveRows()
+        return True
+
+
+class DegreesTable(QtGui.QTableView):
     class PreserveFocusReason(ReasonFlag):
         NONE = ""
         INVALID_NAME = "Invalid name"
         INVALID_SCHOOL = "Invalid school name"
         INVALID_PHONE = "Invalid phone number"
 
-    def __init__(self, test: Test, parent: QtGui.QWidget = None) -> None:
+    def __init__(self, test: Test, changes: ChangeLog, parent: QtGui.QWidget = None) -> None:
         super().__init__(parent)
         self.test = test
+        self.changes = changes
         self.want_focus_reasons = DegreesTable.PreserveFocusReason.NONE
 
         self.bar_headers = headers[:-1]  # no need for `test` now
-        self.setColumnCount(len(self.bar_headers))
-        self.setHorizontalHeaderLabels(self.bar_headers)
+        self.source = DegreesModel(test.student_degrees, changes, self.bar_headers, self)
+        self.proxy = QtGui.QSortFilterProxyModel(self)
+        self.proxy.setSourceModel(self.source)
+        self.proxy.setSortRole(DegreesModel.SortRole)
+        self.proxy.setFilterKeyColumn(-1)
+        self.proxy.setFilterCaseSensitivity(QtCore.Qt.CaseInsensitive)
+        self.setModel(self.proxy)
+
         self.setSelectionBehavior(QtGui.QAbstractItemView.SelectRows)
         self.setSelectionMode(QtGui.QAbstractItemView.SingleSelection)
         self.horizontalHeader().setResizeMode(QtGui.QHeaderView.Interactive)
@@ -39,7 +153,7 @@ class DegreesTable(QtGui.QTableWidget):
 
             if not acceptable:
                 # don't (yet) know why but it works
-                QtCore.QTimer.singleShot(0, lambda: self.editItem(self.item(row, col)))
+                QtCore.QTimer.singleShot(0, lambda: self.edit(self.model().index(row, col)))
 
         name_delegate = NameItemDelegate(self)
         name_delegate.acceptableInputChanged.connect(functools.partial(f, self.bar_headers.index("name")))
@@ -52,34 +166,14 @@ class DegreesTable(QtGui.QTableWidget):
         phone_delegate.acceptableInputChanged.connect(functools.partial(f, self.bar_headers.index("phone")))
         self.setItemDelegateForColumn(self.bar_headers.index("phone"), phone_delegate)
 
-        for degree in self.test.student_degrees:
-            self.add_degree(degree, from_init=True)
-
         self.resizeColumnsToContents()
 
-    def add_degree(self, degree: StudentDegree, from_init=False):
-
-        if not from_init:
-            if degree in self.test.student_degrees:
-                return
-            self.test.student_degrees.append(degree)
-
-        row = self.rowCount()
-        self.insertRow(row)
-
-        for i, header in enumerate(self.bar_headers):
-            item = getattr(degree, header)
-            item = ((', '.join(map(lambda x: str(int(x) + 1), item)) if item else 'N/A')
-                    if isinstance(item, list) else str(item))
-
-            item = QtGui.QTableWidgetItem(item)
-            if header in ("degree", "out_of", "left", "failed_at"):
-                item.setFlags(QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled)
-            item.setTextAlignment(QtCore.Qt.AlignCenter)
-            self.setItem(row, i, item)
+    def add_degree(self, degree: StudentDegree, saved=False):
+        if not saved and degree in self.test.student_degrees:
+            return
 
-        if not from_init:
-            self.resizeColumnsToContents()
+        self.source.append(degree, saved)
+        self.resizeColumnsToContents()
 
     def delete_row(self, row: int):
         if QtGui.QMessageBox.question(self, "Deleting Row {}".format(row + 1),
@@ -87,9 +181,9 @@ class DegreesTable(QtGui.QTableWidget):
                                       " This <font color=red><b>cannot</b></font>"
                                       " be <font color=red><b>undone</b></font>.".format(row=row + 1),
                                       QtGui.QMessageBox.Yes | QtGui.QMessageBox.No) == QtGui.QMessageBox.Yes:
-            self.removeRow(row)
+            self.model().removeRow(row)
 
-        if self.rowCount() == 0:
+        if self.source.rowCount() == 0:
             self.emptied.emit()
 
     def _check_reason(self, reason: PreserveFocusReason, happened: bool):
@@ -120,30 +214,18 @@ class DegreesTable(QtGui.QTableWidget):
             self.delete_row(row)
 
     def keyPressEvent(self, e: QtGui.QKeyEvent):
-        if e.key() == QtCore.Qt.Key_Delete:
-            self.delete_row(self.currentRow())
+        if e.key() == QtCore.Qt.Key_Delete and self.currentIndex().isValid():
+            self.delete_row(self.currentIndex().row())
+        else:
+            super().keyPressEvent(e)
 
     @property
-    def degrees(self) -> List[StudentDegree]:
-        degrees = []
-        for i in range(self.rowCount()):
-            degree = {}
-            for j, header in enumerate(self.bar_headers):
-                if header in ("failed_at", "left"):  # should be converted into a list
-                    text = self.item(i, j).text()
-                    values = list(map(lambda v: int(v) - 1, text.split(", "))) if text != 'N/A' else []
-                    degree[header] = values
-                elif header in ("degree", "out_of"):
-                    degree[header] = float(self.item(i, j).text())
-                else:
-                    degree[header] = self.item(i, j).text()
-            degree = StudentDegree(**degree)
-            degrees.append(degree)
-        return degrees
+    def degrees(self) -> ResultColumns:
+        return self.test.student_degrees
 
     @property
     def edited(self) -> bool:
-        return self.degrees != self.test.student_degrees
+        return self.changes.edited
 
     wantFocusChanged = QtCore.pyqtSignal(PreserveFocusReason, name="wantFocusChanged")
     updateStatus = QtCore.pyqtSignal(str, name="updateStatus")
@@ -151,51 +233,73 @@ class DegreesTable(QtGui.QTableWidget):
 
 
 class DegreesWidget(QtGui.QWidget):
-    def __init__(self, test: Test, parent: QtGui.QWidget = None) -> None:
+    def __init__(self, test: Test, changes: ChangeLog = None, parent: QtGui.QWidget = None) -> None:
+        """`test` is a working copy of the saved test, `changes` what's been edited in it if it's not a fresh one."""
         super().__init__(parent)
         self.test = test
+        self.changes = ChangeLog(len(test.student_degrees)) if changes is None else changes
         self.table = None
         self.lbl = QtGui.QLabel("<font size=5>No student has done this test yet.</font>")
         self.status = QtGui.QLabel()
+        self.filter_edit = QtGui.QLineEdit()
+        self.filter_edit.setPlaceholderText("Filter degrees...")
+        self.filter_edit.textChanged.connect(self.filter)
+        self.regrade_btn = QtGui.QPushButton("Regrade")
+        self.regrade_btn.setToolTip("Grade the recorded answers again against the questions as they are now")
+        self.regrade_btn.clicked.connect(self.regradeRequested.emit)
 
         self.lyt = lyt = QtGui.QVBoxLayout()
         self.setLayout(lyt)
+        top = QtGui.QHBoxLayout()
+        top.addWidget(self.filter_edit)
+        top.addWidget(self.regrade_btn)
+        lyt.addLayout(top)
 
         if not self.test.student_degrees:
+            self.filter_edit.hide()
+            self.regrade_btn.hide()
             lyt.addWidget(self.lbl, 1, alignment=QtCore.Qt.AlignCenter)
         else:
-            self.table = DegreesTable(test)
-            self.table.wantFocusChanged.connect(self.wantFocusChanged.emit)
-            self.table.emptied.connect(lambda: self.replace(to_table=False))
-            self.table.updateStatus.connect(self.status.setText)
-            lyt.addWidget(self.table)
+            self._add_table()
 
         lyt.addWidget(self.status)
 
-    def add_degree(self, degree: StudentDegree):
-        if degree in self.test.student_degrees:
-            return
+    def _add_table(self):
+        self.table = DegreesTable(self.test, self.changes)
+        self.table.wantFocusChanged.connect(self.wantFocusChanged.emit)
+        self.table.emptied.connect(lambda: self.replace(to_table=False))
+        self.table.updateStatus.connect(self.status.setText)
+        self.table.proxy.setFilterFixedString(self.filter_edit.text())
+        self.lyt.insertWidget(1, self.table)
 
-        self.test.student_degrees.append(degree)
+    def add_degree(self, degree: StudentDegree, saved=False):
+        """Adds a row, `saved` if it's already in the saved results (it was just submitted) so it's no edit."""
         if self.table is None:
             self.replace()
+        self.table.add_degree(degree, saved)
+
+    def filter(self, s: str):
+        if self.table is not None:
+            self.table.proxy.setFilterFixedString(s)
 
     def replace(self, to_table=True):
         if to_table:
             if self.lyt.indexOf(self.lbl) != -1:
                 self.lyt.removeWidget(self.lbl)
+                self.lbl.hide()
 
-            self.table = DegreesTable(self.test)
-            self.table.wantFocusChanged.connect(lambda r: self.wantFocusChanged.emit())
-            self.table.emptied.connect(lambda: self.replace(to_table=False))
-            self.table.updateStatus.connect(self.status.setText)
-            self.lyt.addWidget(self.table)
+            self.filter_edit.show()
+            self.regrade_btn.show()
+            self._add_table()
         else:
             if self.table is not None:
                 self.table.deleteLater()
 
             self.table = None
-            self.lyt.addWidget(self.lbl, 1, alignment=QtCore.Qt.AlignCenter)
+            self.filter_edit.hide()
+            self.regrade_btn.hide()
+            self.lbl.show()
+            self.lyt.insertWidget(1, self.lbl, 1, alignment=QtCore.Qt.AlignCenter)
 
     @property
     def want_focus_reasons(self) -> DegreesTable.PreserveFocusReason:
@@ -204,11 +308,40 @@ class DegreesWidget(QtGui.QWidget):
         return self.table.want_focus_reasons
 
     @property
-    def degrees(self) -> List[StudentDegree]:
-        return [] if self.table is None else self.table.degrees
+    def degrees(self) -> ResultColumns:
+        return self.test.student_degrees
 
     @property
     def edited(self) -> bool:
-        return False if self.table is None else self.table.edited
+        return self.changes.edited
+
+    def regrade(self, test: Test):
+        """Regrades the results that have their answers recorded with `test`'s answer key (as it's being edited)."""
+        results = self.test.student_degrees
+        if self.table is None or QtGui.QMessageBox.question(
+                self, "Regrade", "Grade the {} results again against the answers as they are now?".format(len(results)),
+                QtGui.QMessageBox.Yes | QtGui.QMessageBox.No) != QtGui.QMessageBox.Yes:
+            return
+
+        try:
+            rows, grades, other = regrade(AnswerKey(test), results)
+        except ValueError as e:
+            QtGui.QMessageBox.warning(self, "Can't Regrade", str(e))
+            return
+        if other:
+            QtGui.QMessageBox.warning(
+                self, "Regrade", "{} of the results were answered when the questions (or their answers) were"
+                                 " different, they're left as they are.".format(other))
+        changed = self.table.source.regrade(rows, grades, float(test.degree))
+        self.status.setText("Regraded {} of {} results, {} changed. The rest have no answers recorded for every"
+                            " question, or for these questions.".format(len(rows), len(results), changed))
+
+    def apply(self, saved: ResultColumns) -> List[ResultChange]:
+        """
+        Writes the edits made since the last time into `saved` (the results they were made on a copy of), and
+        returns them.
+        """
+        return self.changes.apply(self.test.student_degrees, saved)
 
     wantFocusChanged = QtCore.pyqtSignal(DegreesTable.PreserveFocusReason, name="wantFocusChanged")
+    regradeRequested = QtCore.pyqtSignal(name="regradeRequested")
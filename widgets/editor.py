@@ -1,18 +1,25 @@
-import copy
-from collections import OrderedDict
-from typing import List, Optional, cast, Set
+import itertools
+from collections import OrderedDict, deque
+from typing import List, Optional, Tuple, cast, Set
 
 from PyQt4 import QtCore, QtGui
 from cryptography.fernet import InvalidToken
 
-from data import TESTS
+from data import TESTS, SAVER, STORAGE, load_tests
+from utils.grading import MAX_ANSWERS
 from utils.helpers import (
-    Test, Question, Answer,
+    Test, Question, Answer, StudentDegree,
+    FIXED_TABS,
     res, tab_repr,
     ReasonFlag)
-from utils.parsers import dump_tests, parse_tests
+from utils.parsers import parse_tests
+from utils.results import ResultColumns, ResultChange
+from utils.search import SearchIndex, question_text
+from utils.vals import OPEN_EDITORS
 from widgets.degreesviewer import DegreesWidget, DegreesTable
 from widgets.innerwidgets import QuestionImage, AnswerWidget, TabBar
+from widgets.statsviewer import StatisticsWidget
+from widgets.undo import Field, Move, UndoStack
 
 
 class TestDetails(QtGui.QWidget):
@@ -21,10 +28,12 @@ class TestDetails(QtGui.QWidget):
         INVALID_NAME = "Test name cannot be less than three characters."
         ALREADY_CHOSEN_NAME = "Test name must be unique (there's already a test with the same name)."
 
-    def __init__(self, test: Test = None, parent: QtGui.QWidget = None) -> None:
+    def __init__(self, test: Test = None, parent: QtGui.QWidget = None, undo_stack: UndoStack = None) -> None:
         super().__init__(parent)
         self.s_test = test
-        self.editor = self.parent().parent()  # type: TestsEditor
+        self.editor = self.parent()  # type: TestsEditor
+        while not isinstance(self.editor, TestsEditor):
+            self.editor = self.editor.parent()
 
         lyt = QtGui.QGridLayout()
         self.want_focus_reasons = TestDetails.PreserveFocusReason.NONE
@@ -77,6 +86,17 @@ class TestDetails(QtGui.QWidget):
         self._check_reason(TestDetails.PreserveFocusReason.INVALID_NAME,
                            self.s_test is None or len(self.s_test.name) < 3)
 
+        self.fields = []  # type: List[Field]
+        if undo_stack is not None:
+            self.fields = [
+                Field(undo_stack, "Edit Test Name", self.nameT.text, self.nameT.setText, self.nameT.textChanged),
+                Field(undo_stack, "Edit Test Description", self.descriptionT.toPlainText,
+                      self.descriptionT.setPlainText, self.descriptionT.textChanged),
+                Field(undo_stack, "Edit Test Time", self.timeT.time, self.timeT.setTime, self.timeT.timeChanged),
+                Field(undo_stack, "Edit Test Degree", self.degreeT.value, self.degreeT.setValue,
+                      self.degreeT.valueChanged),
+            ]
+
     def observe_name(self, s: str):
         update = True
         same_name_num = len(list(filter(lambda test: test == s, self.editor.names)))
@@ -111,7 +131,7 @@ class TestDetails(QtGui.QWidget):
         time = self.timeT.time()  # type: QtCore.QTime
         return Test(-1, self.nameT.text(), self.descriptionT.toPlainText(),
                     time.second() + time.minute() * 60 + time.hour() * 60 * 60,
-                    [], float(self.degreeT.value()), [])
+                    [], float(self.degreeT.value()), ResultColumns())
 
     wantFocusChanged = QtCore.pyqtSignal(PreserveFocusReason, name="wantFocusChange")
     nameChanged = QtCore.pyqtSignal(str, name="nameChanged")
@@ -125,19 +145,26 @@ class QuestionTab(QtGui.QWidget):
         NO_CORRECT_ANSWER = "A question cannot have no correct answers."
         ALL_ANSWERS_CORRECT = "A question's answers cannot be all correct."
         EMPTY_ANSWER = "A question's answer cannot be empty."
+        TOO_MANY_ANSWERS = "Number of answers cannot be more than {}.".format(MAX_ANSWERS)
 
-    def __init__(self, question: Question = None, index: int = -1, parent: QtGui.QWidget = None) -> None:
+    def __init__(self, question: Question = None, index: int = -1, parent: QtGui.QWidget = None,
+                 undo_stack: UndoStack = None) -> None:
         super().__init__(parent)
 
+        self.undo_stack = undo_stack
+        self.fields = []  # type: List[Field]
         self.want_focus_reasons = QuestionTab.PreserveFocusReason.NONE
         self.answers_lyt = QtGui.QVBoxLayout()
-        self.s_question = question or Question("", None, [Answer("", False)])
+        self.s_question = question or Question("", None, (Answer("", False),))
         self.answers = []  # type: List[AnswerWidget]
+        self._popped = []  # answers taken off the end by undoing their adding, the last first
         self.deleted = False
+        self.key = None  # given by the test's widget, its undo commands refer to the tab by it
         self.image = QuestionImage(self.s_question.pic and res(self.s_question.pic))
         self.disabled_because = set()   # type: Set[int]
         self.questionT = QtGui.QTextEdit()
         self.questionT.textChanged.connect(self.observe_name)
+        self.questionT.textChanged.connect(self.contentChanged.emit)
         self.answers_num = 0
         self.valid_num = 0
         self.index = index
@@ -180,6 +207,8 @@ class QuestionTab(QtGui.QWidget):
 
         self._check_reason(QuestionTab.PreserveFocusReason.EMPTY_QUESTION, not self.s_question.string)
         self._check_reason(QuestionTab.PreserveFocusReason.NUMBER_OF_ANSWERS, len(self.s_question.answers) < 2)
+        self._check_reason(QuestionTab.PreserveFocusReason.TOO_MANY_ANSWERS,
+                           len(self.s_question.answers) > MAX_ANSWERS)
         self._check_reason(QuestionTab.PreserveFocusReason.NO_CORRECT_ANSWER,
                            not any(ans.valid for ans in self.s_question.answers))
         self._check_reason(QuestionTab.PreserveFocusReason.ALL_ANSWERS_CORRECT,
@@ -187,30 +216,50 @@ class QuestionTab(QtGui.QWidget):
         self._check_reason(QuestionTab.PreserveFocusReason.EMPTY_ANSWER,
                            any(not ans.string for ans in self.s_question.answers))
 
+        if undo_stack is not None:
+            self.fields += [
+                Field(undo_stack, "Edit Question", self.questionT.toPlainText, self.questionT.setPlainText,
+                      self.questionT.textChanged),
+                Field(undo_stack, "Change Image", lambda: self.image.image and self.image.path,
+                      lambda path: self.image.setImage(path) if path else self.image.hideImage(),
+                      self.image.imageShown, self.image.imageHidden),
+            ]
+
+    def _answer_widget(self, answer: Answer, index: int) -> AnswerWidget:
+        widget = AnswerWidget(answer, index, deleteRequest=self.delete_answer, addRequest=self.add_answer,
+                              validityChanged=self.validity_changed)
+        widget.filled.connect(self.filled_answer)
+        widget.isEmpty.connect(self.empty_answer)
+        widget.edt.textChanged.connect(lambda _: self.contentChanged.emit())
+        if self.undo_stack is not None:
+            self.fields += [Field(self.undo_stack, "Edit Answer", widget.edt.text, widget.edt.setText,
+                                  widget.edt.textChanged),
+                            Field(self.undo_stack, "Mark Answer", widget.chk.isChecked, widget.chk.setChecked,
+                                  widget.chk.toggled)]
+        return widget
+
     def add_answer(self, *, answer: Answer = None):
+        widget = self._answer_widget(answer or Answer("", False), len(self.answers))
+        self._append_answer(widget)
+        if self.undo_stack is not None:
+            self.undo_stack.record("Add Answer", lambda: self._append_answer(self._popped.pop()), self._pop_answer)
 
-        if len(self.answers) > 0:
+    def _append_answer(self, widget: AnswerWidget):
+        if self.answers:
             self.answers[-1].last = False
-
-        if answer is None:
-            answer = Answer("", False)
-
-        answer_widget = AnswerWidget(answer, len(self.answers), last=True,
-                                     deleteRequest=self.delete_answer, addRequest=self.add_answer,
-                                     validityChanged=self.validity_changed)
-        answer_widget.filled.connect(self.filled_answer)
-        answer_widget.isEmpty.connect(self.empty_answer)
-
-        if not answer.string:
-            answer_widget.mod.setDisabled(True)
-
-        self.answers.append(answer_widget)
-        self.answers_lyt.addWidget(answer_widget)
-        self.answers_num += 1
-
-        self._check_reason(QuestionTab.PreserveFocusReason.NUMBER_OF_ANSWERS, self.answers_num < 2)
-        self._check_reason(QuestionTab.PreserveFocusReason.EMPTY_ANSWER, not answer.string)
-        self._check_reason(QuestionTab.PreserveFocusReason.ALL_ANSWERS_CORRECT, answer.valid)
+        self.answers.append(widget)
+        self.answers_lyt.addWidget(widget)
+        widget.show()
+        widget.last = True
+        self._recheck()
+
+    def _pop_answer(self):
+        widget = self.answers.pop()
+        self._popped.append(widget)
+        self.answers_lyt.removeWidget(widget)
+        widget.hide()
+        self.answers[-1].last = True
+        self._recheck()
 
     def add_answers(self, answers: List[Answer]):
         assert answers
@@ -223,12 +272,7 @@ class QuestionTab(QtGui.QWidget):
             if i != 0 and not answer.string:
                 continue
 
-            widget = AnswerWidget(answer, len(self.answers),
-                                  deleteRequest=self.delete_answer, addRequest=self.add_answer,
-                                  validityChanged=self.validity_changed)
-            widget.filled.connect(self.filled_answer)
-            widget.isEmpty.connect(self.empty_answer)
-
+            widget = self._answer_widget(answer, len(self.answers))
             self.answers.append(widget)
             self.answers_lyt.addWidget(widget)
 
@@ -237,26 +281,36 @@ class QuestionTab(QtGui.QWidget):
         self.answers_num += len(answers)
 
         self._check_reason(QuestionTab.PreserveFocusReason.NUMBER_OF_ANSWERS, self.answers_num < 2)
+        self._check_reason(QuestionTab.PreserveFocusReason.TOO_MANY_ANSWERS, self.answers_num > MAX_ANSWERS)
         self._check_reason(QuestionTab.PreserveFocusReason.EMPTY_ANSWER,
                            any(not q.string for q in self.question.answers))
 
     def delete_answer(self, index):
-        if {index} == self.disabled_because:
-            self.disabled_because.clear()
-            self.answers[-1 if index != len(self.answers) - 1 else -2].mod.setEnabled(True)
-
-        self.answers_num -= 1
-        answer = self.answers[index]
-        if answer.valid:
-            self.valid_num -= 1
-
-        answer.deleted = True
-        answer.deleteLater()
+        # only hidden (so it keeps its index), it's shown again if that's undone
+        self._set_deleted(self.answers[index], True)
+        if self.undo_stack is not None:
+            self.undo_stack.record("Delete Answer", lambda: self._set_deleted(self.answers[index], True),
+                                   lambda: self._set_deleted(self.answers[index], False))
+
+    def _set_deleted(self, answer: AnswerWidget, deleted: bool):
+        answer.deleted = deleted
+        answer.setHidden(deleted)
+        self._recheck()
+
+    def _recheck(self):
+        """Counts the answers again, after they're added or deleted (or that's undone)."""
+        answers = [answer for answer in self.answers if not answer.deleted]
+        self.answers_num = len(answers)
+        self.valid_num = sum(answer.valid for answer in answers)
+        self.disabled_because = {answer.index for answer in answers if not answer.text}
+        self.answers[-1].mod.setDisabled(bool(self.disabled_because))
 
         self._check_reason(QuestionTab.PreserveFocusReason.NUMBER_OF_ANSWERS, self.answers_num < 2)
+        self._check_reason(QuestionTab.PreserveFocusReason.TOO_MANY_ANSWERS, self.answers_num > MAX_ANSWERS)
         self._check_reason(QuestionTab.PreserveFocusReason.NO_CORRECT_ANSWER, self.valid_num <= 0)
-        self._check_reason(QuestionTab.PreserveFocusReason.EMPTY_ANSWER,
-                           any(not q.string for q in self.question.answers))
+        self._check_reason(QuestionTab.PreserveFocusReason.ALL_ANSWERS_CORRECT, self.valid_num == self.answers_num)
+        self._check_reason(QuestionTab.PreserveFocusReason.EMPTY_ANSWER, bool(self.disabled_because))
+        self.contentChanged.emit()
 
     def validity_changed(self, checked, _):
         if checked:
@@ -305,53 +359,25 @@ class QuestionTab(QtGui.QWidget):
 
     @property
     def question(self):
-        return Question(self.questionT.toPlainText(), self.image.image,
-                        [ans.answer for ans in self.answers if not ans.deleted])
+        question = Question(self.questionT.toPlainText(), self.image.image,
+                            tuple(ans.answer for ans in self.answers if not ans.deleted))
+        # unchanged it's the saved one itself, so telling whether the test's edited is comparing identities
+        return self.s_question if question == self.s_question else question
 
     wantFocusChanged = QtCore.pyqtSignal(int, PreserveFocusReason, name="wantFocusChanged")
-
-
-class DeletedQuestion(QtGui.QWidget):
-    def __init__(self, question: QuestionTab, index: int, parent: QtGui.QWidget = None) -> None:
-        super().__init__(parent)
-
-        self.question = question
-        self.question.deleted = True
-        self._index = index
-
-        self.link = QtGui.QLabel("<a href='#undo'>Undo Close Question {}</a>".format(self.index))
-        self.link.setOpenExternalLinks(False)
-
-        def f(_):
-            self.question.deleted = False
-            self.openRequested.emit(self.index)
-
-        self.link.linkActivated.connect(f)
-
-        lyt = QtGui.QVBoxLayout()
-        self.setLayout(lyt)
-
-        lyt.addWidget(self.link, alignment=QtCore.Qt.AlignCenter)
-
-    @property
-    def index(self):
-        return self._index
-
-    @index.setter
-    def index(self, value):
-        self._index = value
-        self.link.setText("<a href='#undo'>Undo Close Question {}</a>".format(self.index))
-
-    openRequested = QtCore.pyqtSignal(int, name="openRequested")
+    # the question's or an answer's text changed, or an answer was added or deleted
+    contentChanged = QtCore.pyqtSignal(name="contentChanged")
 
 
 class TestTabWidget(QtGui.QTabWidget):
 
-    def __init__(self, test: Test, item: QtGui.QListWidgetItem, parent: QtGui.QWidget = None) -> None:
+    def __init__(self, test: Test, item: QtGui.QListWidgetItem, search: SearchIndex,
+                 parent: QtGui.QWidget = None) -> None:
         super().__init__(parent)
 
         self._item = item
         self.s_test = test
+        self.search = search
         self.setTabBar(TabBar())
         self.setTabsClosable(True)
         self.setUpdatesEnabled(True)
@@ -361,95 +387,194 @@ class TestTabWidget(QtGui.QTabWidget):
         btn.setIcon(QtGui.QIcon(res("add.png", "icon")))
         btn.clicked.connect(self.add_question)
         self.setCornerWidget(btn)
+        self.currentChanged.connect(self.tab_changed)
+        self.tabBar().tabMoved.connect(self.tab_moved)
+        self.tabCloseRequested.connect(self.delete_question)
+
+        # the tabs are only built once the test is opened, and can be released again (see `release`), what was
+        # being edited is then kept as the test it makes up (`draft`) and the changes to its results (a `ChangeLog`)
+        self.built = False
+        self.draft = None  # type: Optional[Test]
+        self.changes = None
+        self.details = self.degrees_widget = self.stats_widget = None
+        # every edit of the test (but those of its results, see `ChangeLog`) is a command on the stack, which is cleared
+        # when the tabs are released, `drafted` is whether there was anything unsaved then
+        self.undo_stack = UndoStack(self)
+        self.drafted = False
+        # question tabs taken out (deleted, or their adding undone), the commands on the stack may put them back,
+        # they're deleted once it's cleared
+        self._detached = set()  # type: Set[QuestionTab]
+        # the commands refer to a question tab by its key, so they don't keep it (see `_tab`)
+        self._keys = itertools.count()
+        self._tabs = {}  # key -> QuestionTab, shown or detached
+        # the rows of its results changed by saves that failed, they go with the next one
+        self.unsaved = None  # type: Optional[List[ResultChange]]
+        # the tabs with errors and their reasons, kept as they're reported, and them by index once asked for
+        self._errors = {}  # widget -> the `ReasonFlag` of its errors
+        self._errors_by_index = OrderedDict()  # type: Optional[OrderedDict]
+        self._index_questions()
+
+    def build(self):
+        if self.built:
+            return
+        self.built = True
+        test = self.draft or self.s_test
 
-        self.details = details = TestDetails(test, parent=self)
-        details.wantFocusChanged.connect(lambda r: self.updateErrors.emit(self.errors))
+        self.details = details = TestDetails(test, parent=self, undo_stack=self.undo_stack)
+        self._reasons_changed(details, details.want_focus_reasons, emit=False)
+        details.wantFocusChanged.connect(lambda r: self._reasons_changed(details, r))
         details.nameChanged.connect(lambda s: self.nameChanged.emit(self.index, s))
+        details.nameT.textChanged.connect(lambda s: self.search.set(self, "name", s))
         self.addTab(details, "Details")
         self.tabBar().tabButton(0, QtGui.QTabBar.RightSide).resize(0, 0)  # makes it not closable
 
-        self.degrees_widget = degrees_widget = DegreesWidget(copy.deepcopy(test), parent=self)
+        if self.draft is None:
+            # the questions and answers are tuples (see `test`), shared as they are, the results are copied when
+            # either is written
+            degrees_widget = DegreesWidget(test._replace(student_degrees=test.student_degrees.copy()), parent=self)
+        else:
+            degrees_widget = DegreesWidget(self.draft, self.changes, parent=self)
+        self.degrees_widget = degrees_widget
+        self.drafted = self.draft is not None
+        self.draft = self.changes = None
 
         def f(r):
             self.tabBar().setEnabled(r is DegreesTable.PreserveFocusReason.NONE)
             self.cornerWidget().setEnabled(r is DegreesTable.PreserveFocusReason.NONE)
-            self.updateErrors.emit(self.errors)
+            self._reasons_changed(degrees_widget, r)
 
         degrees_widget.wantFocusChanged.connect(f)
+        degrees_widget.regradeRequested.connect(lambda: degrees_widget.regrade(self.test))
         self.addTab(degrees_widget, "Degrees")
         self.tabBar().tabButton(1, QtGui.QTabBar.RightSide).resize(0, 0)  # makes it not closable
 
-        self.tabBar().tabMoved.connect(self.tab_moved)
+        self.stats_widget = StatisticsWidget(degrees_widget.degrees, parent=self)
+        self.addTab(self.stats_widget, "Statistics")
+        self.tabBar().tabButton(2, QtGui.QTabBar.RightSide).resize(0, 0)
 
+        self.search.set_all(self, [("name", test.name)])  # and every question's indexed by its tab as it's added
         for question in test.questions:
             self.add_question(question=question, setfocus=False)
 
-        self.tabCloseRequested.connect(self.delete_question)
+    def release(self) -> bool:
+        """
+        Drops the tabs, keeping what's being edited (but not how to undo it). Not when there's an error in them.
+        """
+        if not self.built or self._errors:
+            return False
 
-    def delete_question(self, index):
+        if self.edited:
+            self.draft, self.changes = self.test, self.degrees_widget.changes
+        self.clear_undo()
+        self.built = False
+        self.details = self.degrees_widget = self.stats_widget = None
+        for i in reversed(range(self.count())):
+            widget = self.widget(i)
+            self.removeTab(i)
+            widget.deleteLater()
+        self._tabs.clear()
+        self._index_questions()
+        return True
+
+    def clear_undo(self):
+        """Clears the undo stack, and deletes the tabs only its commands could have put back."""
+        self.undo_stack.clear()
+        for tab in self._detached:
+            self._tabs.pop(tab.key)
+            tab.deleteLater()
+        self._detached.clear()
+
+    def _index_questions(self):
+        # while the tabs are built a question's indexed by its tab (as it's edited), by where it is when they aren't
+        test = self.draft or self.s_test
+        self.search.set_all(self, [("name", test.name)] + [(i, question_text(question))
+                                                           for i, question in enumerate(test.questions)])
+
+    def result_arrived(self, degree: StudentDegree):
+        """A result just submitted, the saved test already has it."""
+        if self.built:
+            self.degrees_widget.add_degree(degree, saved=True)
+        elif self.draft is not None:
+            self.draft.student_degrees.append(degree)
+            self.changes.arrived()
+
+    def _tab(self, key: int) -> QuestionTab:
+        return self._tabs[key]
 
-        old_ques = self.widget(index)
-        if (isinstance(old_ques, DeletedQuestion)
-                and QtGui.QMessageBox.question(self, "Are you sure?",
-                                               "Are you sure you want to <font color=red>force delete</font> {}?"
-                                               " This cannot be "
-                                               "<b><font color=red>undone</font></b>.".format(tab_repr(index)),
-                                               QtGui.QMessageBox.Yes | QtGui.QMessageBox.No) == QtGui.QMessageBox.Yes):
-
-            self.removeTab(index)
-            self._check_questions_name(*range(index, self.count()))
-
-        elif QtGui.QMessageBox.question(self, "Are you sure?",
-                                        "Are you sure you want to delete {}?".format(tab_repr(index)),
-                                        QtGui.QMessageBox.Yes | QtGui.QMessageBox.No) == QtGui.QMessageBox.Yes:
-            self.removeTab(index)
-            del_ques = DeletedQuestion(old_ques, index, self)
-            del_ques.openRequested.connect(self.open_deleted_question)
-            self.insertTab(index, del_ques, tab_repr(index, deleted=True))
-            self.tabBar().tabButton(index, QtGui.QTabBar.RightSide).setToolTip("Force Delete Question")
-            self.setCurrentIndex(index)
-            self.updateErrors.emit(self.errors)
+    def delete_question(self, index):
+        # the tab's kept detached, undoing it puts it back
+        key = self.widget(index).key
+        self._remove_question(self._tab(key))
+        self.undo_stack.record("Delete Question", lambda: self._remove_question(self._tab(key)),
+                               lambda: self._insert_question(index, self._tab(key)))
 
     def add_question(self, *, question=None, setfocus=True):
         index = self.count()
-        tab = QuestionTab(question, index)
-        tab.wantFocusChanged.connect(lambda i, r: self.updateErrors.emit(self.errors))
-        self.addTab(tab, tab_repr(self.count()))
+        tab = QuestionTab(question, index, undo_stack=self.undo_stack)
+        tab.key = key = next(self._keys)
+        self._tabs[key] = tab
+        tab.wantFocusChanged.connect(lambda i, r: self._reasons_changed(tab, r))
+        tab.contentChanged.connect(lambda: self.search.set(self, tab, question_text(tab.question)))
+        self._insert_question(index, tab, setfocus)
+        if question is None:  # a new one, not one of the test's as it's built
+            self.undo_stack.record("Add Question", lambda: self._insert_question(index, self._tab(key)),
+                                   lambda: self._remove_question(self._tab(key)))
+
+    def _insert_question(self, index: int, tab: QuestionTab, setfocus=True):
+        self._detached.discard(tab)
+        self.insertTab(index, tab, tab_repr(index))
         tab.questionT.setFocus()
         btn = self.tabBar().tabButton(index, QtGui.QTabBar.RightSide)
         btn.setToolTip("Delete Question")
         if setfocus:
             self.setCurrentIndex(index)
+        self._reasons_changed(tab, tab.want_focus_reasons, emit=setfocus)
+        self._check_questions_name(*range(index + 1, self.count()))
+        self.search.set(self, tab, question_text(tab.question))
+
+    def _remove_question(self, tab: QuestionTab):
+        index = self.indexOf(tab)
+        self.removeTab(index)
+        self._detached.add(tab)
+        self._reasons_changed(tab, QuestionTab.PreserveFocusReason.NONE)  # a deleted one can't be wrong
+        self._check_questions_name(*range(index, self.count()))
+        self.search.remove(self, tab)
 
     def _check_questions_name(self, *locations):
         for loc in locations:
             wid = self.widget(loc)
-            if isinstance(wid, (QuestionTab, DeletedQuestion)):
-                if loc in (0, 1):
-                    loc += 2
-                self.setTabText(loc, tab_repr(loc, deleted=type(wid) is DeletedQuestion))
+            if isinstance(wid, QuestionTab):
+                if loc < len(FIXED_TABS):
+                    loc += len(FIXED_TABS)
+                self.setTabText(loc, tab_repr(loc))
 
     def tab_moved(self, from_: int, to: int):
-        if from_ in (0, 1):
+        if from_ < len(FIXED_TABS):
             self.tabBar().moveTab(to, from_)
+        elif not self.undo_stack.applying:
+            self.undo_stack.push(Move(self.undo_stack, self.tabBar(), from_, to))
 
+        self._errors_by_index = None
         self.updateErrors.emit(self.errors)
         self._check_questions_name(from_, to)
 
-    def open_deleted_question(self, index):
-        question = self.widget(index).question
-        self.removeTab(index)
-        self.insertTab(index, question, tab_repr(index))
-        self.tabBar().tabButton(index, QtGui.QTabBar.RightSide).setToolTip("Delete Question")
-        self.setCurrentIndex(index)
-        self.updateErrors.emit(self.errors)
+    def tab_changed(self, index: int):
+        if self.stats_widget is not None and self.widget(index) is self.stats_widget:  # only worked out when looked at
+            self.stats_widget.refresh(sum(isinstance(self.widget(i), QuestionTab) for i in range(self.count())))
+
+    @property
+    def name(self) -> str:
+        return self.details.nameT.text() if self.built else (self.draft or self.s_test).name
 
     @property
     def test(self):
+        if not self.built:
+            return self.draft or self.s_test
         details = self.widget(0).test  # type: Test
-        return Test(self.index, details.name, details.description, details.time,
-                    [self.widget(i).question for i in range(1, self.count()) if
-                     isinstance(self.widget(i), QuestionTab)],
+        # tuples, like a loaded test's, so what `commit` makes the saved test can't be changed under it
+        return Test(self.s_test.id, details.name, details.description, details.time,
+                    tuple(self.widget(i).question for i in range(len(FIXED_TABS), self.count()) if
+                          isinstance(self.widget(i), QuestionTab)),
                     details.degree, self.degrees_widget.degrees)
 
     @property
@@ -459,25 +584,59 @@ class TestTabWidget(QtGui.QTabWidget):
 
     @property
     def edited(self):
-        return self.test != self.s_test
+        # every edit's on the stack (or in the results' change log), so it's only whether there's any since the save,
+        # a draft is only kept when there was
+        if self.unsaved is not None:
+            return True
+        if not self.built:
+            return self.draft is not None
+        return self.drafted or not self.undo_stack.isClean() or self.degrees_widget.edited
+
+    def commit(self) -> Tuple[Test, List[ResultChange]]:
+        """
+        Applies the edits to the saved test, which becomes what's shown now. Returns it with the rows of its results
+        that changed (since the last save that didn't fail).
+        """
+        test = self.test
+        changes = self.unsaved or []
+        self.unsaved = None
+        if self.built:
+            changes += self.degrees_widget.apply(self.s_test.student_degrees)
+        elif self.draft is not None:
+            changes += self.changes.apply(self.draft.student_degrees, self.s_test.student_degrees)
+            self.draft = self.changes = None  # nothing left that isn't saved, it's built from the saved test again
+        self.undo_stack.setClean()
+        self.drafted = False
+        self.s_test = test._replace(student_degrees=self.s_test.student_degrees)
+        return self.s_test, changes
+
+    def save_failed(self, changes: List[ResultChange]):
+        """The save of what `commit` gave back failed, it's edited (unsaved) again."""
+        self.unsaved = (self.unsaved or []) + changes
+
+    def _reasons_changed(self, widget: QtGui.QWidget, reasons: ReasonFlag, emit=True):
+        if reasons in (TestDetails.PreserveFocusReason.NONE, QuestionTab.PreserveFocusReason.NONE,
+                       DegreesTable.PreserveFocusReason.NONE):
+            self._errors.pop(widget, None)
+        else:
+            self._errors[widget] = reasons
+        self._errors_by_index = None
+        if emit:
+            self.updateErrors.emit(self.errors)
 
     @property
-    def errors(self):
-        errs = OrderedDict()
-        for i in range(0, self.count()):
-            widget = self.widget(i)
-            if isinstance(widget, (TestDetails, QuestionTab, DegreesWidget)):
-                reasons = widget.want_focus_reasons
-            elif isinstance(widget, DeletedQuestion):
-                reasons = QuestionTab.PreserveFocusReason.NONE  # emulate that nothing is wrong
-            else:
-                raise ValueError("Unknown page: {}".format(type(widget).__name__))
-
-            if reasons not in (TestDetails.PreserveFocusReason.NONE, QuestionTab.PreserveFocusReason.NONE,
-                               DegreesTable.PreserveFocusReason.NONE):
-                errs[i] = reasons
+    def has_errors(self) -> bool:
+        return bool(self._errors)
 
-        return errs
+    @property
+    def errors(self) -> OrderedDict:
+        """The reasons of the tabs with errors by their index, in order."""
+        if self._errors_by_index is None:
+            # only the few tabs with errors are looked up
+            self._errors_by_index = OrderedDict(sorted(((self.indexOf(widget), reasons)
+                                                        for widget, reasons in self._errors.items()),
+                                                       key=lambda error: error[0]))
+        return self._errors_by_index
 
     nameChanged = QtCore.pyqtSignal(int, str, name="nameChanged")
     updateErrors = QtCore.pyqtSignal(OrderedDict, name="updateErrors")
@@ -490,7 +649,9 @@ class TestsEditor(QtGui.QMainWindow):
         self.setWindowTitle("Tests Editor")
 
         self.just_deleted_a_test = False  # used in navigation (not to test that there were errors in the deleted test)
-        self.old_tests = None  # type: Optional[List[Test]]
+        # the saves not written yet, in order: their futures, `TESTS` before and after them and the widgets they
+        # committed (with the rows of the results they changed), which are edited again if they fail
+        self.saving = deque()  # type: deque
 
         open_action = QtGui.QAction("&Open", self)
         open_action.setShortcut("Ctrl+O")
@@ -501,7 +662,17 @@ class TestsEditor(QtGui.QMainWindow):
 
         open_action.triggered.connect(self.open)
         save_action.triggered.connect(self.save)
+        SAVER.saved.connect(self.saved)
+        SAVER.failed.connect(self.save_failed)
+        SAVER.results_added.connect(self.results_added)
         quit_action.triggered.connect(self.close)
+
+        # every test has its undo stack, the one shown is the group's active one
+        self.undo_group = QtGui.QUndoGroup(self)
+        undo_action = self.undo_group.createUndoAction(self, "&Undo")
+        undo_action.setShortcut(QtGui.QKeySequence.Undo)
+        redo_action = self.undo_group.createRedoAction(self, "&Redo")
+        redo_action.setShortcut(QtGui.QKeySequence.Redo)
         menu_bar = self.menuBar()
 
         file_menu = menu_bar.addMenu("&File")
@@ -510,6 +681,10 @@ class TestsEditor(QtGui.QMainWindow):
         file_menu.addSeparator()
         file_menu.addAction(quit_action)
 
+        edit_menu = menu_bar.addMenu("&Edit")
+        edit_menu.addAction(undo_action)
+        edit_menu.addAction(redo_action)
+
         sts_bar = QtGui.QStatusBar()
         sts_bar.setStyleSheet("QStatusBar { background-color: #ccc; border-top: 1.5px solid grey } ")
         self.sts_bar_lbl = QtGui.QLabel("Ready.")
@@ -535,7 +710,7 @@ class TestsEditor(QtGui.QMainWindow):
         save_btn.setToolTip("Save Tests")
 
         filter_edit = QtGui.QLineEdit()
-        filter_edit.setPlaceholderText("Search tests...")
+        filter_edit.setPlaceholderText("Search tests, questions and answers...")
         filter_edit.textChanged.connect(self.update_tests_list)
 
         self.tests_list = QtGui.QListWidget()
@@ -585,12 +760,15 @@ class TestsEditor(QtGui.QMainWindow):
         lyt.addItem(QtGui.QSpacerItem(10, 1), 0, 2)
 
         self.tests_widget = QtGui.QStackedWidget()
+        self.search_index = SearchIndex()  # of the names, questions and answers of the tests, see `update_tests_list`
+        self.recent = []  # type: List[TestTabWidget]  # the built ones, the most recently opened last
 
-        for test in TESTS:
+        for test in load_tests():
             self.add_test(test)
 
         if TESTS:
             self.tests_list.setCurrentItem(self.tests_list.item(0))
+            self.open_test(0)
 
         lyt.addWidget(self.tests_widget, 0, 3, 2, 3)
         lyt.addWidget(save_btn, 2, 5)
@@ -599,11 +777,14 @@ class TestsEditor(QtGui.QMainWindow):
         lyt.setRowStretch(1, 1)
 
     def add_test(self, test: Test):
+        if test.id < 0:
+            test = test._replace(id=self.next_id)
         item = QtGui.QListWidgetItem(test.name, self.tests_list)
-        question_widget = TestTabWidget(test, item, parent=self)
+        question_widget = TestTabWidget(test, item, self.search_index, parent=self)
         question_widget.updateErrors.connect(self.update_status_bar)
         question_widget.updateErrors.connect(lambda err: self.save_btn.setEnabled(not err))
         question_widget.nameChanged.connect(self.update_name)
+        self.undo_group.addStack(question_widget.undo_stack)
         self.tests_widget.addWidget(question_widget)
 
     def delete_test(self, *, index=-1):
@@ -620,12 +801,19 @@ class TestsEditor(QtGui.QMainWindow):
                 self._current_row -= 2
             elif index <= self.tests_list.currentRow():
                 self._current_row -= 1
-            self.tests_widget.removeWidget(self.tests_widget.widget(index))
+            widget = self.tests_widget.widget(index)
+            if widget in self.recent:
+                self.recent.remove(widget)
+            self.undo_group.removeStack(widget.undo_stack)
+            self.search_index.drop(widget)
+            self.tests_widget.removeWidget(widget)
+            widget.deleteLater()  # its tabs, detached ones too, and undo stack with it
+            if self.tests_widget.count():
+                self.open_test(self.tests_widget.currentIndex())
 
     def open_test_dialog(self, _):
         cur_wid = self.tests_widget.currentWidget()
-        errors = cur_wid and cur_wid.errors
-        if errors:
+        if cur_wid is not None and cur_wid.has_errors:
             QtGui.QMessageBox.warning(self, "Invalid Operation", "Cannot add test while there's an error.")
             return
 
@@ -667,8 +855,8 @@ class TestsEditor(QtGui.QMainWindow):
             return
 
         widget = self.tests_widget.widget(previous_index)
-        errs = widget.errors if widget is not None else []
-        if not self.just_deleted_a_test and errs:
+        if not self.just_deleted_a_test and widget is not None and widget.has_errors:
+            errs = widget.errors
             locs = ", ".join(tab_repr(i) for i in errs)
             QtGui.QMessageBox.warning(self, "Cannot Change The Current Test.",
                                       "Test `{}` has some errors so you can't leave it. See the {} tab{}."
@@ -680,9 +868,23 @@ class TestsEditor(QtGui.QMainWindow):
             self.just_deleted_a_test = False
             self._current_row = self.tests_list.row(current)
 
-        self.tests_widget.setCurrentIndex(current_index)
+        self.open_test(current_index)
         self.update_status_bar()
 
+    def open_test(self, index: int):
+        """Shows the test at `index`, building its tabs if they aren't, and releases those not used for long."""
+        widget = self.tests_widget.widget(index)  # type: TestTabWidget
+        widget.build()
+        if widget in self.recent:
+            self.recent.remove(widget)
+        self.recent.append(widget)
+        self.tests_widget.setCurrentIndex(index)
+        self.undo_group.setActiveStack(widget.undo_stack)
+
+        for old in self.recent[:-OPEN_EDITORS]:
+            if old.release():
+                self.recent.remove(old)
+
     def update_status_bar(self, errs: OrderedDict = None):
         if errs is None:
             errs = self.tests_widget.currentWidget().errors
@@ -695,29 +897,97 @@ class TestsEditor(QtGui.QMainWindow):
             self.sts_bar_lbl.setText("Ready.")
 
     def update_tests_list(self, s: str):
-        for i in range(self.tests_list.count()):
-            item = self.tests_list.item(i)
-            item.setHidden(s not in item.text())
+        # the tests with a question (or answer, or name) having every word searched for
+        found = self.search_index.search(s)
+        for i, widget in enumerate(self.widgets):
+            self.tests_list.item(i).setHidden(found is not None and widget not in found)
 
     def save(self) -> bool:
-        errors = self.tests_widget.currentWidget().errors
-        if errors:
+        """
+        Queues a save of the tests, False if they can't be saved. They're only saved once `saved` is called (or
+        `wait_saved` returns True), if it fails what it had is edited again.
+        """
+        if STORAGE.read_only:
+            QtGui.QMessageBox.warning(self, "Invalid Operation", "The tests can only be saved on the machine serving"
+                                                                 " them.")
+            return False
+        if self.tests_widget.currentWidget().has_errors:
             QtGui.QMessageBox.warning(self, "Invalid Operation", "Cannot save while there's an error.")
             return False
         else:
+            self.sts_bar_lbl.setText("Saving...")
+
+            saved_ids = {test.id for test in TESTS}
+            new_tests = []
+            changed = []
+            deltas = {}
+            committed = []
+            for widget in self.widgets:
+                # only what's edited is made up again from the widgets, the rest is saved as it is
+                if widget.s_test.id not in saved_ids or widget.edited:
+                    test, deltas[widget.s_test.id] = widget.commit()
+                    committed.append((widget, deltas[test.id]))
+                    changed.append(test.id)
+                    new_tests.append(test)
+                else:
+                    new_tests.append(widget.s_test)
+
+            old_tests = TESTS[:]
+            TESTS.clear()
+            TESTS.extend(new_tests)
+
+            self.saving.append((SAVER.save(new_tests, changed, deltas), old_tests, new_tests, committed))
+            return True
+
+    def saves_done(self) -> bool:
+        """
+        Goes over the saves written since it was last called, in order. `TESTS` is put back as it was before the
+        ones that failed, and what they committed is edited again. False if any did.
+        """
+        errors = []
+        while self.saving and self.saving[0][0].done():
+            future, old_tests, new_tests, committed = self.saving.popleft()
+            error = future.exception()
+            if error is None:
+                if not self.saving:  # otherwise it's the tests of the last one already
+                    TESTS[:] = new_tests
+                continue
+
+            errors.append(str(error))
+            TESTS[:] = old_tests
+            for widget, changes in committed:
+                widget.save_failed(changes)
+            # what's stored is still what was before it, for the ones after it too
+            self.saving = deque((f, old_tests, n, c) for f, _, n, c in self.saving)
+
+        if errors:
+            self.sts_bar_lbl.setText("Couldn't save the tests.")
+            QtGui.QMessageBox.warning(self, "Couldn't Save", "The tests couldn't be saved:\n" + errors[-1])
+        elif not self.saving:
             self.sts_bar_lbl.setText("Saved Tests.")
             QtCore.QTimer.singleShot(3000, self.update_status_bar)
+        return not errors
 
-            new_tests = self.tests
-            for widget, test in zip(self.widgets, new_tests):
-                widget.s_test = test
+    def wait_saved(self) -> bool:
+        """Waits for the saves queued to be written, False if any of them failed."""
+        self.sts_bar_lbl.setText("Saving...")
+        SAVER.flush()
+        return self.saves_done()
 
-            self.old_tests = TESTS[:]
-            TESTS.clear()
-            TESTS.extend(new_tests)
+    @QtCore.pyqtSlot()
+    def saved(self):
+        self.saves_done()
 
-            dump_tests(new_tests, res("data.enc", "state"), encrypt=True)
-            return True
+    @QtCore.pyqtSlot(str)
+    def save_failed(self, _):
+        self.saves_done()  # which shows the error, its save's future has it
+
+    def results_added(self, results: List[Tuple[int, StudentDegree]]):
+        # `data` has already added them to the saved tests, they're shown as they arrive
+        widgets = {widget.s_test.id: widget for widget in self.widgets}
+        for test_id, degree in results:
+            if test_id in widgets:
+                widgets[test_id].result_arrived(degree)
 
     def open(self):
         file, _ = QtGui.QFileDialog.getOpenFileNameAndFilter(self, caption="Load new tests",
@@ -744,7 +1014,7 @@ class TestsEditor(QtGui.QMainWindow):
         same_name_different_details = []
         same_name_different_questions = []
         names = self.names
-        for i, test in enumerate(new_tests, TESTS[-1].id + 1):
+        for i, test in enumerate(new_tests, self.next_id):
             test_dict = test._asdict()
             test_dict["id"] = i
             test = Test(**test_dict)
@@ -800,6 +1070,7 @@ class TestsEditor(QtGui.QMainWindow):
                 overridden_test = Test(**old_test_dict)
                 TESTS[index] = overridden_test
 
+                self.tests_widget.widget(index).build()
                 details_tab = self.tests_widget.widget(index).widget(0)  # type: TestDetails
 
                 details_tab.descriptionT.setPlainText(test.description)
@@ -838,7 +1109,7 @@ class TestsEditor(QtGui.QMainWindow):
             result = QtGui.QMessageBox.question(self, "Are you sure you want to exit?",
                                                 "You have some unsaved changes. Do you want to save them?",
                                                 QtGui.QMessageBox.Yes | QtGui.QMessageBox.No | QtGui.QMessageBox.Cancel)
-            if result == QtGui.QMessageBox.Yes and self.save():
+            if result == QtGui.QMessageBox.Yes and self.save() and self.wait_saved():
                 pass
             elif result == QtGui.QMessageBox.No:
                 pass
@@ -851,15 +1122,19 @@ class TestsEditor(QtGui.QMainWindow):
 
     @property
     def edited(self) -> bool:
-        return len(self.tests) != len(TESTS) or any(wid.edited for wid in self.widgets)
+        return self.tests_widget.count() != len(TESTS) or any(wid.edited for wid in self.widgets)
 
     @property
     def widgets(self) -> List[TestTabWidget]:
         return cast(List[TestTabWidget], [self.tests_widget.widget(i) for i in range(0, self.tests_widget.count())])
 
+    @property
+    def next_id(self) -> int:
+        return max([test.id for test in TESTS] + [widget.s_test.id for widget in self.widgets], default=-1) + 1
+
     @property
     def names(self) -> List[str]:
-        return [widget.widget(0).nameT.text() for widget in self.widgets]
+        return [widget.name for widget in self.widgets]
 
     @property
     def tests(self) -> List[Test]:
@@ -5,9 +5,11 @@ from typing import Optional
 from PyQt4 import QtGui, QtCore
 
 from utils.helpers import (
-    Test, Answer,
+    TestSummary, Answer,
+    FIXED_TABS,
     res, format_secs,
 )
+from utils.images import IMAGES, STORE
 from utils.vals import GRADES
 
 
@@ -92,6 +94,8 @@ class QuestionImage(QtGui.QFrame):
         lyt.setRowStretch(0, 1)
         lyt.setColumnStretch(0, 1)
 
+        # the image is painted once it's decoded in the background rather than waited for
+        IMAGES.loaded.connect(self.image_loaded)
         if image is not None:
             self.setImage(image)
 
@@ -105,11 +109,8 @@ class QuestionImage(QtGui.QFrame):
         self.close_btn.show()
         self.lbl.hide()
 
-        self.setStyleSheet("""
-            QuestionImage {{
-                border-image: url("{}");
-            }}
-        """.format(image.replace("\\", "/")))  # fucking windows
+        IMAGES.prefetch(image)
+        self.update()
 
     def hideImage(self):
 
@@ -119,17 +120,25 @@ class QuestionImage(QtGui.QFrame):
         self.close_btn.hide()
         self.add_btn.show()
         self.lbl.show()
+        self.update()
 
-        self.setStyleSheet("""
-            QuestionImage {
-                border-image: none;
-            }
-        """)
+    @QtCore.pyqtSlot(str)  # a slot of its own, so it's disconnected as the widget is deleted
+    def image_loaded(self, path: str):
+        if path == self.path:
+            self.update()
+
+    def paintEvent(self, event: QtGui.QPaintEvent):
+        super().paintEvent(event)
+        if self.image is not None and self.path:
+            pixmap = IMAGES.get(self.path, wait=False)
+            if pixmap is not None:
+                # stretched over the whole frame like a border-image
+                QtGui.QPainter(self).drawPixmap(self.rect(), pixmap)
 
     def choose_image(self):
         f, _ = QtGui.QFileDialog.getOpenFileNameAndFilter(self.parent(), filter="Images (*.png *.xpm *.jpg)")
         if f:
-            self.setImage(f)
+            self.setImage(STORE.path(STORE.import_image(f)))
 
     @property
     def path(self):
@@ -245,7 +254,7 @@ class ColorBox(QtGui.QWidget):
 
 
 class TestCard(QtGui.QFrame):
-    def __init__(self, test: Test, index: int, parent=None, **kwargs) -> None:
+    def __init__(self, test: TestSummary, index: int, parent=None, **kwargs) -> None:
         super().__init__(parent, **kwargs)
         self.index = index
 
@@ -262,7 +271,7 @@ class TestCard(QtGui.QFrame):
         btn.clicked.connect(self.open)
         lyt.addWidget(QtGui.QLabel(), 2, 0)
         text = re.sub(r'\b(\d+)\b', r'<b>\1</b>', "%s | %d درجة | %d سؤال"
-                      % (format_secs(test.time), int(test.degree), len(test.questions)))
+                      % (format_secs(test.time), int(test.degree), test.questions))
         lyt.addWidget(QtGui.QLabel("<font size=3 color=grey>%s</font>" % text),
                       3, 0, 1, 2, alignment=QtCore.Qt.AlignLeft)
         lyt.addWidget(btn, 4, 1, alignment=QtCore.Qt.AlignRight)
@@ -277,7 +286,7 @@ class TestCard(QtGui.QFrame):
 
 class TabBar(QtGui.QTabBar):
     def mousePressEvent(self, event: QtGui.QMouseEvent):
-        self.setMovable(self.tabAt(event.pos()) not in (0, 1))
+        self.setMovable(self.tabAt(event.pos()) >= len(FIXED_TABS))
         super().mousePressEvent(event)
 
 
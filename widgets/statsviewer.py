@@ -0,0 +1,104 @@
+import math
+from typing import List
+
+from PyQt4 import QtCore, QtGui
+
+from utils.analytics import GroupStats, StatsCache, TestStats
+from utils.results import ResultColumns
+
+
+class StatisticsWidget(QtGui.QWidget):
+    """
+    The item analysis of a test's results (as they're being edited), worked out when it's shown and only again
+    once they've changed since.
+    """
+
+    def __init__(self, results: ResultColumns, parent: QtGui.QWidget = None) -> None:
+        super().__init__(parent)
+        self.results = results
+        self.cache = StatsCache()
+        self.shown = None  # the `TestStats` drawn, they're not drawn again while they're the same
+
+        self.lbl = QtGui.QLabel("<font size=5>No student has done this test yet.</font>")
+        self.summary = QtGui.QLabel()
+
+        self.questions_table = QtGui.QTableWidget(0, 4)
+        self.questions_table.setHorizontalHeaderLabels(["Difficulty", "Discrimination", "Left", "Failed"])
+        self.questions_table.setToolTip("Difficulty: got credit for it, Discrimination: how much more the best 27%"
+                                        " got credit for it than the worst 27% did")
+        self.questions_table.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+
+        self.histogram = QtGui.QGraphicsView()
+        self.histogram.setStyleSheet("background-color: transparent")
+        self.histogram.setMinimumHeight(160)
+
+        self.groups_table = QtGui.QTableWidget(0, 3)
+        self.groups_table.setHorizontalHeaderLabels(["", "Students", "Mean"])
+        self.groups_table.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+
+        self.stats = QtGui.QWidget()
+        grid = QtGui.QGridLayout()
+        self.stats.setLayout(grid)
+        grid.addWidget(self.summary, 0, 0, 1, 2)
+        grid.addWidget(self.questions_table, 1, 0, 2, 1)
+        grid.addWidget(self.histogram, 1, 1)
+        grid.addWidget(self.groups_table, 2, 1)
+        grid.setColumnStretch(0, 1)
+        grid.setColumnStretch(1, 1)
+
+        lyt = QtGui.QVBoxLayout()
+        self.setLayout(lyt)
+        lyt.addWidget(self.lbl, 1, alignment=QtCore.Qt.AlignCenter)
+        lyt.addWidget(self.stats)
+
+    def refresh(self, questions: int):
+        stats = self.cache.get(self.results, questions)
+        if stats is self.shown:
+            return
+        self.shown = stats
+
+        self.lbl.setVisible(not stats.count)
+        self.stats.setVisible(bool(stats.count))
+        if not stats.count:
+            return
+
+        self.summary.setText("<b>{}</b> results, mean <b>{:.1f}%</b>, median <b>{:.1f}%</b>, standard deviation"
+                             " <b>{:.1f}</b>".format(stats.count, stats.mean, stats.median, stats.std))
+        self._fill_questions(stats)
+        self._draw_histogram(stats)
+        self._fill_groups(stats.schools, stats.grades)
+
+    def _fill_questions(self, stats: TestStats):
+        columns = (stats.questions.difficulty, stats.questions.discrimination, stats.questions.omission,
+                   stats.questions.failure)
+        table = self.questions_table
+        table.setRowCount(len(columns[0]))
+        table.setVerticalHeaderLabels(["Q {}".format(i + 1) for i in range(len(columns[0]))])
+        for col, values in enumerate(columns):
+            for row, value in enumerate(values.tolist()):
+                item = QtGui.QTableWidgetItem("N/A" if math.isnan(value) else "{:.2f}".format(value))
+                item.setTextAlignment(QtCore.Qt.AlignCenter)
+                table.setItem(row, col, item)
+        table.resizeColumnsToContents()
+
+    def _draw_histogram(self, stats: TestStats):
+        counts, edges = stats.histogram
+        scene = QtGui.QGraphicsScene()
+        width, height = 32, 120
+        top = max(counts.max(), 1)
+        for i, count in enumerate(counts.tolist()):
+            bar = height * count / top
+            rect = scene.addRect(i * width, height - bar, width - 4, bar, brush=QtGui.QBrush(QtGui.QColor(0, 128, 0)))
+            rect.setToolTip("{:.0f}% - {:.0f}%: {}".format(edges[i], edges[i + 1], count))
+            label = scene.addText("{:.0f}".format(edges[i]))
+            label.setPos(i * width - 4, height)
+        self.histogram.setScene(scene)
+
+    def _fill_groups(self, schools: List[GroupStats], grades: List[GroupStats]):
+        table = self.groups_table
+        table.setRowCount(len(schools) + len(grades))
+        table.setVerticalHeaderLabels(["School"] * len(schools) + ["Grade"] * len(grades))
+        for row, group in enumerate(schools + grades):
+            for col, value in enumerate((group.name, str(group.count), "{:.1f}%".format(group.mean))):
+                table.setItem(row, col, QtGui.QTableWidgetItem(value))
+        table.resizeColumnsToContents()
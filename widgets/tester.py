@@ -1,20 +1,55 @@
 import random
-from typing import List, Optional
+from contextlib import suppress
+from typing import Optional
 
 from PyQt4 import QtGui, QtCore
 
-from data import TESTS
+from data import SAVER
+from utils.grading import AnswerKey, grade, response_mask
 from utils.helpers import (
     Test, Question, StudentDegree,
-    res,
 )
-from utils.parsers import dump_tests
+from utils.images import IMAGES, STORE
 from utils.vals import headers, GRADES
 from widgets.innerwidgets import ColorBox
 
 
+class QuestionRecord(object):
+    """What's been answered in a question, kept apart from its page so the page can be built only when needed."""
+
+    def __init__(self, question: Question) -> None:
+        self.question = question
+        self.order = random.sample(range(len(question.answers)), len(question.answers))  # the order they're shown in
+        self.answers = [question.answers[i] for i in self.order]
+        self.valid = [i for i, a in enumerate(self.answers) if a.valid]
+        self.is_radio = len(self.valid) == 1
+        self.checked = set()  # indices into `answers`
+
+    @property
+    def response(self) -> int:
+        """The answers checked as a bitmask by their place in the question, what `grading` takes."""
+        return response_mask(self.order[i] for i in self.checked)
+
+
 class TestWizard(QtGui.QWizard):
-    degrees = []  # type: List[int]
+    grades = None  # of the answers, once they're graded
+
+    # question pages built ahead of the one being shown
+    PREFETCH = 2
+
+    @staticmethod
+    def problem(test: Test) -> Optional[str]:
+        """
+        Why `test` can't be taken, if it can't: a question with more answers than a response holds, or with no
+        valid answer (every answer of it would be disabled). The editor doesn't save either, an imported bank might.
+        """
+        try:
+            key = AnswerKey(test)
+        except ValueError as e:
+            return str(e)
+        if not key.counts.all():
+            return "question {} has no valid answer".format(int((key.counts == 0).argmax()) + 1)
+        return None
 
     def __init__(self, test: Test, parent: QtGui.QWidget = None) -> None:
         super().__init__(parent)
@@ -22,7 +57,7 @@ class TestWizard(QtGui.QWizard):
         self.question_num = len(self.test.questions)
         self.parent_window = None   # type: Optional[QtGui.QWidget]
         self.already_visited_pages = None
-        self.degree_per_q = self.test.degree / len(self.test.questions)
+        self.key = AnswerKey(self.test)
         self.setButtonText(self.NextButton, 'التالي >')
         self.setButtonText(self.CancelButton, 'الغاء')
         self.setButtonText(self.FinishButton, 'انتهي')
@@ -40,16 +75,18 @@ class TestWizard(QtGui.QWizard):
 
         self.addPage(FormPage())
 
-        for id_, question in enumerate(self.test.questions):
-            self.addPage(QuestionPage(id_ + 1, question))
+        self.records = [QuestionRecord(question) for question in self.test.questions]
+        self.question_pages = [QuestionPage(id_ + 1, record) for id_, record in enumerate(self.records)]
+        for page in self.question_pages:
+            self.addPage(page)
+        self.prefetch_images(0)
 
         self.addPage(FinalPage())
 
         def f():
             self.calculate()
-            d = self.degrees
 
-            if not all(i != -1 for i in d) and not self.timeout:
+            if self.grades.left.any() and not self.timeout:
                 msg_box = QtGui.QMessageBox(QtGui.QMessageBox.Warning,
                                             "انتبه", 'انت لم تجب عن كل السئلة، هل تريد المتابعة؟',
                                             QtGui.QMessageBox.NoButton, self)
@@ -68,6 +105,7 @@ class TestWizard(QtGui.QWizard):
         self.timer.timeout.connect(self.update_lcd)
         self.timeout = self.timer_started = False
         self.finished_answering = False
+        SAVER.results_failed.connect(self.save_failed)
 
     def update_lcd(self):
         self.time -= 1
@@ -126,22 +164,43 @@ class TestWizard(QtGui.QWizard):
         if isinstance(p, QuestionPage):
             p.lcdScreen.display("%d:%02d" % (self.time // 60, self.time % 60))
 
+    def prefetch(self, id_: int):
+        for page in self.question_pages[id_:id_ + self.PREFETCH]:
+            page.build()
+        self.prefetch_images(id_ + self.PREFETCH)
+
+    def prefetch_images(self, id_: int):
+        # the thumbnails are made (if they weren't) and decoded in the background a few pages before they're built
+        for record in self.records[id_:id_ + 2 * self.PREFETCH]:
+            if record.question.pic:
+                STORE.prefetch_thumbnail(record.question.pic, IMAGES)
+
     def calculate(self):
-        self.degrees = []
-        for p in self.pageIds():
-            p = self.page(p)
-            if isinstance(p, QuestionPage):
-                self.degrees.append(p.degree)
+        self.grades = grade(self.key, [record.response for record in self.records])
+
+    def save_failed(self, error: str):
+        QtGui.QMessageBox.warning(self, "خطأ في الحفظ", "لم يتم حفظ النتيجة:\n" + error)
+
+    def teardown(self):
+        # `SAVER` outlives every wizard
+        with suppress(TypeError):  # disconnected already
+            SAVER.results_failed.disconnect(self.save_failed)
+
+    def done(self, result: int):
+        self.teardown()
+        super().done(result)
 
     def closeEvent(self, event: QtGui.QCloseEvent):
         if not self.pageIds()[-1] > self.currentId() > 0:
             if self.parent_window is not None:
                 self.parent_window.show()
+            self.teardown()
             event.accept()
         elif (QtGui.QMessageBox.question(self, "هل انت متأكد؟", "انت علي وشك ان تغلق النافذة، كل الإجابات سوف تنسي.",
                                          QtGui.QMessageBox.Yes | QtGui.QMessageBox.No)) == QtGui.QMessageBox.Yes:
             if self.parent_window is not None:
                 self.parent_window.show()
+            self.teardown()
             event.accept()
         else:
             event.ignore()
@@ -214,15 +273,20 @@ class FormPage(QtGui.QWizardPage):
 
         if len(self.nameedit.text().split(" ")) < 2:
             QtGui.QMessageBox.information(self, "خطأ في الاسم", 'يرجي ادخال الاسم ثنائيا او اكثر')
-        elif any(student.name == self.nameedit.text() and student.grade == self.gradecombo.currentText()
-                 for student in self.wizard().test.student_degrees):
+        elif self.gradecombo.currentText() == "<ادخل صفك>":
+            QtGui.QMessageBox.information(self, "خطأ في الصف", 'يرجي ادخال الصف')
+        elif self.wizard().test.student_degrees.has_student(self.nameedit.text(), self.gradecombo.currentText()):
             return QtGui.QMessageBox.question(self, "خطأ في الإدخال",
                                               "لقد امتحن '{}' (بالنظر للاسم والصف) هذا الإمتحات من قبل. "
                                               "هل تريد إعادة الإمتحان (او انه شخص مختلف)؟"
                                               .format(self.nameedit.text()),
                                               QtGui.QMessageBox.Yes | QtGui.QMessageBox.No) == QtGui.QMessageBox.Yes
-        elif self.gradecombo.currentText() == "<ادخل صفك>":
-            QtGui.QMessageBox.information(self, "خطأ في الصف", 'يرجي ادخال الصف')
+        elif self.numberedit.text().strip() and self.wizard().test.student_degrees.has_phone(self.numberedit.text()):
+            return QtGui.QMessageBox.question(self, "خطأ في الإدخال",
+                                              "رقم التليفون '{}' مسجل لطالب امتحن هذا الإمتحان من قبل. "
+                                              "هل تريد المتابعة؟"
+                                              .format(self.numberedit.text()),
+                                              QtGui.QMessageBox.Yes | QtGui.QMessageBox.No) == QtGui.QMessageBox.Yes
         else:
             return True
 
@@ -276,13 +340,13 @@ class FinalPage(QtGui.QWizardPage):
         lyt.insertLayout(1, group_and_color)
 
     def initializePage(self):
-        degrees = self.wizard().degrees
+        grades = self.wizard().grades
         test = self.wizard().test
         name = self.field("name").title()
         school = self.field("school")
         grade = GRADES[int(self.field("grade")) - 1]
         number = self.field("number")
-        sum_of_degrees = float(sum(i for i in degrees if i != -1))
+        sum_of_degrees = float(grades.totals[0])
 
         if not number.startswith("+2"):
             number = "+2" + number
@@ -292,13 +356,8 @@ class FinalPage(QtGui.QWizardPage):
         self.gradeL.setText(grade)
         self.numberL.setText(number)
 
-        failed_at = []
-        left = []
-        for i, v in enumerate(degrees):
-            if v == 0:
-                failed_at.append(i)
-            elif v == -1:
-                left.append(i)
+        failed_at = grades.failed_at(0)
+        left = grades.left_at(0)
 
         student = dict(zip(headers, [name,
                                      school,
@@ -308,7 +367,6 @@ class FinalPage(QtGui.QWizardPage):
                                      test.degree,
                                      left,
                                      failed_at,
-                                     test.name,
                                      ]))
 
         questions_n = len(test.questions)
@@ -338,21 +396,41 @@ class FinalPage(QtGui.QWizardPage):
         view.setStyleSheet("background-color: transparent")
         self.lyt.insertWidget(0, view)
 
-        test.student_degrees.append(StudentDegree(**student))
-        dump_tests(TESTS, res("data.enc", "state"), encrypt=True)
+        # `data` adds it to the loaded tests once it's written
+        responses = [record.response for record in self.wizard().records]
+        SAVER.add_result(test, StudentDegree(responses=responses, fingerprint=self.wizard().key.fingerprint,
+                                             **student))
 
 
 class QuestionPage(QtGui.QWizardPage):
+    """
+    A page of a question, its widgets are only built when it's about to be shown (or prefetched a page or two
+    before that), what's answered is kept in its `QuestionRecord`.
+    """
 
-    def __init__(self, id_: int, question: Question, parent=None):
+    def __init__(self, id_: int, record: QuestionRecord, parent=None):
 
         super().__init__(parent)
         self.id = id_
-        self.degree = -1
-        random.shuffle(question.answers)
-        self.question = question
-        self.valid = [question.answers.index(a) for a in self.question.answers if a.valid]
-        self.is_radio = len(self.valid) == 1
+        self.record = record
+        self.built = False
+        self.setTitle("سؤال رقم " + str(self.id))
+
+    @QtCore.pyqtSlot(str)  # a slot of its own, so it's disconnected as the page is deleted
+    def image_loaded(self, path: str):
+        name = self.record.question.pic
+        if path in (STORE.thumb_path(name), STORE.path(name)):
+            pixmap = IMAGES.get(path, wait=False)
+            if pixmap is not None:
+                self.pic.setPixmap(pixmap)
+                IMAGES.loaded.disconnect(self.image_loaded)
+
+    def build(self):
+        if self.built:
+            return
+        self.built = True
+        record = self.record
+        question = record.question
         self.pic = QtGui.QLabel()
 
         my_layout = QtGui.QVBoxLayout()
@@ -362,34 +440,37 @@ class QuestionPage(QtGui.QWizardPage):
         self.question.setFont(QtGui.QFont("Times", weight=QtGui.QFont.Bold))
         self.question.setWordWrap(True)
         my_layout.addWidget(self.question)
-        self.setTitle("سؤال رقم " + str(self.id))
         my_layout.addWidget(QtGui.QLabel("<hr>"))
 
         answers_images_lyt = QtGui.QHBoxLayout()
         answers_lyt = QtGui.QVBoxLayout()
 
-        if self.is_radio:
-            self.answers = QtGui.QButtonGroup()
-            for a in question.answers:
+        if record.is_radio:
+            self.answers = QtGui.QButtonGroup(self)
+            for i, a in enumerate(record.answers):
                 btn = QtGui.QRadioButton(a.string)
+                btn.setChecked(i in record.checked)
                 btn.clicked.connect(self.answering)
-                self.answers.addButton(btn)
+                self.answers.addButton(btn, i)
                 answers_lyt.addWidget(btn)
         else:
             self.answers = []
-            for a in question.answers:
+            for i, a in enumerate(record.answers):
                 btn = QtGui.QCheckBox(a.string)
+                btn.setChecked(i in record.checked)
                 btn.stateChanged.connect(self.answering)
                 answers_lyt.addWidget(btn)
                 self.answers.append(btn)
-                self.checkbox_clicked = 0
+            self._limit_checks()
 
         answers_images_lyt.addLayout(answers_lyt, 3)
         answers_images_lyt.addStretch(1)
         answers_images_lyt.addWidget(self.pic, 2, alignment=QtCore.Qt.AlignRight)
         my_layout.addLayout(answers_images_lyt)
         if question.pic:
-            self.pic.setPixmap(QtGui.QPixmap(res(question.pic)))
+            # shown once it's made and decoded in the background, if it isn't yet
+            IMAGES.loaded.connect(self.image_loaded)
+            STORE.prefetch_thumbnail(question.pic, IMAGES)
 
         self.lcdScreen = QtGui.QLCDNumber()
         self.lcdScreen.setSegmentStyle(QtGui.QLCDNumber.Flat)
@@ -411,38 +492,22 @@ class QuestionPage(QtGui.QWizardPage):
 
     def answering(self, state):
 
-        if self.is_radio:
-            valid = tuple(map(lambda x: -2 - x, self.valid))
-            if self.answers.checkedId() == valid[0]:
-                self.degree = self.wizard().degree_per_q
-            else:
-                self.degree = 0
+        if self.record.is_radio:
+            self.record.checked = {self.answers.checkedId()}
         else:
-            if state == QtCore.Qt.Checked:
-                self.checkbox_clicked += 1
-            elif state == QtCore.Qt.Unchecked:
-                self.checkbox_clicked -= 1
-
-            if len(self.valid) == self.checkbox_clicked:
-                for i in self.answers:
-                    if not i.isChecked():
-                        i.setDisabled(True)
-            elif len(self.valid) > self.checkbox_clicked:
-                for i in self.answers:
-                    if not i.isChecked():
-                        i.setDisabled(False)
-
-            # none is checked, this can't happen with the radio buttons
-            if not any(i.isChecked() for i in self.answers):
-                self.degree = -1
-                return
-
-            self.degree = 0
-            for i, b in enumerate(self.answers):
-                if b.isChecked() and i in self.valid:
-                    self.degree += self.wizard().degree_per_q / len(self.valid)
+            self.record.checked = {i for i, b in enumerate(self.answers) if b.isChecked()}
+            self._limit_checks()
+
+    def _limit_checks(self):
+        # no checking more answers than the valid ones
+        full = len(self.record.checked) >= len(self.record.valid)
+        for i in self.answers:
+            if not i.isChecked():
+                i.setDisabled(full)
 
     def initializePage(self):
+        self.build()
         time = self.wizard().time
         self.lcdScreen.display("%d:%02d" % (time // 60, time % 60))
         self.number_label.setText("{} / {}".format(self.id, self.wizard().question_num))
+        QtCore.QTimer.singleShot(0, lambda: self.wizard().prefetch(self.id))
@@ -0,0 +1,115 @@
+from typing import Any, Callable
+
+from PyQt4 import QtGui
+
+
+class UndoStack(QtGui.QUndoStack):
+    """
+    The edits of a test, a small command each. What's pushed has already been done in the widgets (a command's first
+    `redo` does nothing), and what the widgets do while a command is undone or redone isn't recorded again, that's
+    what `applying` is for.
+
+    It's clean as long as nothing's been edited since the test was saved, so that's all telling whether it's edited
+    takes.
+    """
+
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self.applying = False
+
+    def apply(self, f: Callable[[], Any]) -> None:
+        applying, self.applying = self.applying, True
+        try:
+            f()
+        finally:
+            self.applying = applying
+
+    def record(self, text: str, do: Callable[[], Any], undo: Callable[[], Any]) -> None:
+        """Pushes an edit that's just been done, `do` does it again and `undo` undoes it."""
+        if not self.applying:
+            self.push(Edit(self, text, do, undo))
+
+
+class Edit(QtGui.QUndoCommand):
+    def __init__(self, stack: UndoStack, text: str, do: Callable[[], Any], undo: Callable[[], Any]) -> None:
+        super().__init__(text)
+        self.stack = stack
+        self._do = do
+        self._undo = undo
+        self._pushed = True
+
+    def redo(self):
+        if self._pushed:  # it's done already
+            self._pushed = False
+        else:
+            self.stack.apply(self._do)
+
+    def undo(self):
+        self.stack.apply(self._undo)
+
+
+class Move(Edit):
+    """A tab moved, moves in a row (a tab dragged past a few others) are one."""
+
+    def __init__(self, stack: UndoStack, tab_bar: QtGui.QTabBar, from_: int, to: int) -> None:
+        super().__init__(stack, "Move Question", lambda: tab_bar.moveTab(self.from_, self.to),
+                         lambda: tab_bar.moveTab(self.to, self.from_))
+        self.from_ = from_
+        self.to = to
+
+    def id(self) -> int:
+        return 1
+
+    def mergeWith(self, other: QtGui.QUndoCommand) -> bool:
+        if not isinstance(other, Move) or other.from_ != self.to:
+            return False
+        self.to = other.to
+        return True
+
+
+class Field(object):
+    """
+    A value in a widget, every change of it (as any of `signals` is emitted) is pushed on `stack`. It's kept by the
+    widget, so it lives as long as it does.
+    """
+
+    def __init__(self, stack: UndoStack, text: str, get: Callable[[], Any], set_: Callable[[Any], Any],
+                 *signals) -> None:
+        self.stack = stack
+        self.text = text
+        self.get = get
+        self._set = set_
+        self.value = get()
+        for signal in signals:
+            signal.connect(self.changed)
+
+    def changed(self, *_):
+        value = self.get()
+        if value == self.value:
+            return
+        old, self.value = self.value, value
+        if not self.stack.applying:
+            self.stack.push(FieldEdit(self, old, value))
+
+    def set(self, value) -> None:
+        self.value = value
+        self._set(value)
+
+
+class FieldEdit(Edit):
+    """A `Field` changed, changes of the same one in a row (typing) are one."""
+
+    def __init__(self, field: Field, old, new) -> None:
+        super().__init__(field.stack, field.text, lambda: field.set(self.new), lambda: field.set(self.old))
+        self.field = field
+        self.old = old
+        self.new = new
+
+    def id(self) -> int:
+        return 2
+
+    def mergeWith(self, other: QtGui.QUndoCommand) -> bool:
+        if not isinstance(other, FieldEdit) or other.field is not self.field:
+            return False
+        self.new = other.new
+        return True